@@ -5,11 +5,23 @@ import sys
 import json
 import time
 import os
+import asyncio
+import argparse
 import tempfile
 import subprocess
 import requests
 from urllib.parse import urlparse, parse_qs
 
+# TikHub 客户端（连接池 + 同步外观）放在 douyin-downloader 技能里，三个脚本共用
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "skills", "douyin-downloader", "scripts"))
+from tikhub_client import TikHubBudgetError, TikHubClient, get_sync_client, set_client_defaults
+from response_cache import default_cache
+from video_record import normalize_response
+from rate_limit import DEFAULT_DAILY_LIMIT, DEFAULT_RATE, DEFAULT_STATE_PATH, RateLimiter
+from endpoint_health import DEFAULT_HEALTH_PATH, DEFAULT_HEDGE_DELAY, EndpointHealth, hedged_first
+
+DEFAULT_CONCURRENCY = 8
+
 def extract_modal_id_from_url(url):
     """从抖音链接中提取modal_id或video_id"""
     # 处理短链接重定向
@@ -48,67 +60,85 @@ def extract_modal_id_from_url(url):
     
     return None
 
-def get_douyin_video_info(video_id, api_token):
-    """使用TikHub API获取抖音视频信息"""
+# 默认顺序；有健康数据后按 EndpointHealth.order 重新排序
+API_ENDPOINTS = ("video_data", "video_detail")
+
+def parse_video_info(data, video_id=None):
+    """把 video_data / video_detail 的响应转换成统一的视频信息，无法识别时返回 None"""
+    record = normalize_response(data, video_id)
+    return record.as_video_info() if record is not None else None
+
+async def fetch_douyin_video_info(client, video_id, quiet=False, errors=None, health=None, hedge_delay=DEFAULT_HEDGE_DELAY):
+    """
+    使用TikHub API获取抖音视频信息（异步版本，client 为 TikHubClient）
+    端点按 health（EndpointHealth，可为 None）排序并对冲请求：前一个端点
+    hedge_delay 秒内没有有效结果就同时请求下一个，取最先返回的有效结果。
+    quiet 时不打印过程日志；errors 为列表时收集每个端点的失败原因
+    """
     if not video_id:
         return None
+    if client.offline:
+        health = None  # 离线时没有真实请求，不影响端点健康度
     
-    # 尝试不同的API端点
-    api_endpoints = [
-        f"https://api.tikhub.io/douyin/video_data?video_id={video_id}",
-        f"https://api.tikhub.io/douyin/video_detail?video_id={video_id}"
-    ]
+    def log(message, error=False):
+        if error and errors is not None:
+            errors.append(message)
+        if not quiet:
+            print(message, file=sys.stderr)
     
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    
-    for api_url in api_endpoints:
+    async def query(name):
+        log(f"尝试API: {name}?video_id={video_id}")
+        started = time.monotonic()
         try:
-            print(f"尝试API: {api_url}", file=sys.stderr)
-            response = requests.get(api_url, headers=headers, timeout=30)
-            print(f"API响应状态: {response.status_code}", file=sys.stderr)
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"API响应数据: {json.dumps(data, ensure_ascii=False)}", file=sys.stderr)
-                
-                if data.get('status') == 'success' or 'data' in data:
-                    video_info = data.get('data', {}) if isinstance(data.get('data'), dict) else {}
-                    
-                    # 处理不同格式的API响应
-                    if 'title' in video_info:
-                        return {
-                            'title': video_info.get('title', '未知标题'),
-                            'author': video_info.get('author', {}).get('nickname', '未知作者'),
-                            'description': video_info.get('desc', '') or video_info.get('description', ''),
-                            'cover_url': video_info.get('cover_url', '') or video_info.get('cover', ''),
-                            'video_url': video_info.get('video_url', '') or video_info.get('play_addr', ''),
-                            'duration': video_info.get('duration', 0),
-                            'create_time': video_info.get('create_time', '')
-                        }
-                    elif 'aweme_detail' in video_info:
-                        # 处理抖音原生API格式
-                        aweme = video_info['aweme_detail']
-                        return {
-                            'title': aweme.get('desc', '未知标题'),
-                            'author': aweme.get('author', {}).get('nickname', '未知作者'),
-                            'description': aweme.get('desc', ''),
-                            'cover_url': aweme.get('video', {}).get('cover', {}).get('url_list', [''])[0],
-                            'video_url': aweme.get('video', {}).get('play_addr', {}).get('url_list', [''])[0],
-                            'duration': aweme.get('video', {}).get('duration', 0) // 1000,  # 转换为秒
-                            'create_time': aweme.get('create_time', '')
-                        }
-            else:
-                print(f"HTTP错误: {response.status_code}", file=sys.stderr)
-                if response.status_code == 404:
-                    continue  # 尝试下一个端点
+            response = await getattr(client, name)(video_id)
+        except TikHubBudgetError as e:
+            # 请求没有发出，不算端点故障
+            log(f"{name}: {e}", error=True)
+            return None
         except Exception as e:
-            print(f"API请求异常: {e}", file=sys.stderr)
-            continue
+            if health is not None:
+                health.record_failure(name)
+            log(f"{name}: API请求异常: {e}", error=True)
+            return None
+        latency = time.monotonic() - started
+        log(f"API响应状态: {response.status}" + ("（缓存）" if response.from_cache else ""))
+        
+        data = response.data if response.status == 200 else None
+        # 5xx、429 和 200 却不是 JSON 算端点故障；其余 4xx 是这条视频的问题，不影响端点健康度
+        healthy = response.status < 500 and response.status != 429 and (response.status != 200 or isinstance(data, dict))
+        if health is not None and not response.from_cache:
+            if healthy:
+                health.record_success(name, latency)
+            else:
+                health.record_failure(name, latency)
+        
+        if response.status != 200:
+            log(f"{name}: HTTP错误: {response.status}", error=True)
+            return None
+        if not isinstance(data, dict):
+            log(f"{name}: API响应不是JSON对象", error=True)
+            return None
+        if not quiet:  # 批量模式下省掉整份响应的序列化
+            log(f"API响应数据: {json.dumps(data, ensure_ascii=False)}")
+        
+        info = parse_video_info(data, video_id)
+        if info is None:
+            log(f"{name}: 响应中没有可识别的视频信息", error=True)
+        return info
     
-    return None
+    order = health.order(API_ENDPOINTS) if health is not None else list(API_ENDPOINTS)
+    attempts = [(name, lambda name=name: query(name)) for name in order]
+    if health is None:
+        return await hedged_first(attempts, hedge_delay=hedge_delay)
+    try:
+        return await hedged_first(attempts, hedge_delay=hedge_delay, on_cancel=health.record_cancelled)
+    finally:
+        health.release(order)
+
+def get_douyin_video_info(video_id, api_token, health=None, hedge_delay=DEFAULT_HEDGE_DELAY):
+    """使用TikHub API获取抖音视频信息（同步外观，复用进程内的连接池）"""
+    tikhub = get_sync_client(api_token)
+    return tikhub.run(fetch_douyin_video_info(tikhub.client, video_id, health=health, hedge_delay=hedge_delay))
 
 def generate_content_summary(video_info):
     """生成内容摘要"""
@@ -128,14 +158,93 @@ def generate_content_summary(video_info):
     }
     return summary
 
-def main():
-    if len(sys.argv) < 3:
-        print("用法: python douyin_content_parser.py <抖音链接或modal_id> <api_token>", file=sys.stderr)
-        sys.exit(1)
-    
-    input_arg = sys.argv[1]
-    api_token = sys.argv[2]
-    
+async def resolve_video_id(raw):
+    """extract_modal_id_from_url 的异步版本：短链接的重定向请求放到线程里，不阻塞事件循环"""
+    if 'v.douyin.com' in raw:
+        return await asyncio.to_thread(extract_modal_id_from_url, raw)
+    return extract_modal_id_from_url(raw)
+
+async def parse_one(client, index, raw, **options):
+    """解析一条输入，返回一条 NDJSON 记录；失败原因写在记录里，不抛异常"""
+    record = {'index': index, 'input': raw}
+    started = time.monotonic()
+    try:
+        video_id = await resolve_video_id(raw)
+        record['video_id'] = video_id
+        if not video_id:
+            record.update(ok=False, error="无法从输入中提取视频ID")
+        else:
+            errors = []
+            video_info = await fetch_douyin_video_info(client, video_id, quiet=True, errors=errors, **options)
+            summary = generate_content_summary(video_info)
+            record['ok'] = bool(video_info)
+            record.update(summary)
+            if errors and not video_info:
+                record['details'] = errors
+    except Exception as e:
+        record.update(ok=False, error=f"{type(e).__name__}: {e}")
+    record['seconds'] = round(time.monotonic() - started, 3)
+    return record
+
+async def iter_input_lines(stream):
+    """逐行读取输入（跳过空行和 # 注释），读文件/管道的阻塞调用放到线程里"""
+    while True:
+        line = await asyncio.to_thread(stream.readline)
+        if not line:
+            return
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+async def run_bulk(inputs, api_token, concurrency=DEFAULT_CONCURRENCY, out=None, health=None, hedge_delay=DEFAULT_HEDGE_DELAY,
+                   cache=None, offline=False, limiter=None):
+    """
+    批量解析：inputs 为链接/ID 的异步迭代器，concurrency 个 worker 共用一个
+    TikHubClient 连接池；每条记录完成即以 NDJSON 写到 out 并 flush。
+    health 的健康文件在运行中定期写入，结束时再写一次；cache、offline、limiter 见 TikHubClient。
+    返回 (总数, 成功数)。
+    """
+    out = out or sys.stdout
+    concurrency = max(1, concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {'total': 0, 'ok': 0}
+
+    async def worker(client):
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            record = await parse_one(client, *job, health=health, hedge_delay=hedge_delay)
+            counts['ok'] += record['ok']
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if health is not None:
+                health.save()
+
+    # 对冲时一条输入可能同时占用每个端点各一个连接
+    async with TikHubClient(api_token, pool_limit=concurrency * len(API_ENDPOINTS), cache=cache, offline=offline,
+                            limiter=limiter) as client:
+        workers = [asyncio.create_task(worker(client)) for _ in range(concurrency)]
+        try:
+            async for raw in inputs:
+                await queue.put((counts['total'], raw))
+                counts['total'] += 1
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if health is not None:
+                health.save(force=True)
+    return counts['total'], counts['ok']
+
+async def _iter_list(items):
+    for item in items:
+        yield item
+
+def parse_single(input_arg, api_token, health=None, hedge_delay=DEFAULT_HEDGE_DELAY):
+    """单条模式：保持原有输出（缩进JSON），失败时退出码为 1"""
     print(f"输入参数: {input_arg}", file=sys.stderr)
     
     # 提取视频ID
@@ -147,7 +256,9 @@ def main():
         sys.exit(1)
     
     # 获取视频信息
-    video_info = get_douyin_video_info(video_id, api_token)
+    video_info = get_douyin_video_info(video_id, api_token, health=health, hedge_delay=hedge_delay)
+    if health is not None:
+        health.save(force=True)
     
     if not video_info:
         print("无法获取视频信息", file=sys.stderr)
@@ -159,5 +270,76 @@ def main():
     # 输出JSON结果
     print(json.dumps(summary, ensure_ascii=False, indent=2))
 
+def print_stats(cache, limiter, offline):
+    """缓存命中统计和今日额度使用情况，打印到 stderr"""
+    if cache is not None:
+        print(cache.stats_line(), file=sys.stderr)
+    if not offline:
+        print(limiter.report_line(), file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="通过TikHub API解析抖音视频信息",
+        usage="python douyin_content_parser.py <抖音链接或modal_id> <api_token>\n"
+              "       python douyin_content_parser.py --file ids.txt [--concurrency N] <api_token>",
+        epilog="批量模式（--file、多个链接或从标准输入读取）按完成顺序输出 NDJSON，每行一条"
+               "generate_content_summary 记录，带 index/input/video_id/ok；失败的条目写 error 字段，不中断其余条目。",
+    )
+    parser.add_argument("args", nargs="+", metavar="链接 ... api_token", help="一个或多个抖音链接/modal_id，最后一个参数为 api_token")
+    parser.add_argument("--file", help="批量输入文件，每行一个链接或ID；'-' 表示标准输入")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"批量模式的并发请求数（默认 {DEFAULT_CONCURRENCY}）")
+    parser.add_argument("--hedge-delay", type=float, default=DEFAULT_HEDGE_DELAY,
+                        help=f"首选端点多少秒内没有结果就同时请求下一个端点（默认 {DEFAULT_HEDGE_DELAY}，0 表示同时请求）")
+    parser.add_argument("--health-file", default=DEFAULT_HEALTH_PATH,
+                        help="端点健康度/延迟记录文件，空字符串表示不持久化（默认 %(default)s）")
+    parser.add_argument("--offline", action="store_true", help="只从本地缓存回答，不请求TikHub")
+    parser.add_argument("--no-cache", action="store_true", help="不读写本地响应缓存（默认 ~/.cache/tikhub，见 TIKHUB_CACHE_* 环境变量）")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="所有进程合计的TikHub请求速率上限（次/秒，0 表示不限，默认 %(default)s，环境变量 TIKHUB_RATE）")
+    parser.add_argument("--daily-limit", type=int, default=DEFAULT_DAILY_LIMIT,
+                        help="每日（UTC）请求额度，用完后不再请求（0 表示不限，默认 %(default)s，环境变量 TIKHUB_DAILY_LIMIT）")
+    args = parser.parse_args()
+
+    api_token = args.args[-1]
+    links = args.args[:-1]
+
+    health = EndpointHealth(args.health_file or None)
+    cache = None if args.no_cache else default_cache()
+    limiter = RateLimiter(DEFAULT_STATE_PATH, rate=args.rate, daily_limit=args.daily_limit)
+    if len(links) == 1 and not args.file:
+        set_client_defaults(cache=cache, offline=args.offline, limiter=limiter)
+        try:
+            parse_single(links[0], api_token, health=health, hedge_delay=args.hedge_delay)
+        finally:
+            print_stats(cache, limiter, args.offline)
+        return
+
+    if args.file:
+        stream = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8')
+        inputs = iter_input_lines(stream)
+    elif links:
+        stream = None
+        inputs = _iter_list(links)
+    else:
+        if sys.stdin.isatty():
+            parser.error("需要抖音链接、--file 或标准输入")
+        stream = sys.stdin
+        inputs = iter_input_lines(stream)
+
+    started = time.monotonic()
+    try:
+        total, ok = asyncio.run(run_bulk(inputs, api_token, concurrency=args.concurrency,
+                                          health=health, hedge_delay=args.hedge_delay,
+                                          cache=cache, offline=args.offline, limiter=limiter))
+    finally:
+        if stream is not None and stream is not sys.stdin:
+            stream.close()
+    elapsed = time.monotonic() - started
+    print(f"完成 {total} 条: 成功 {ok}, 失败 {total - ok}, 用时 {elapsed:.1f}s", file=sys.stderr)
+    print_stats(cache, limiter, args.offline)
+    # 条目级错误已写在输出里；只有全部失败时才返回非零
+    if total and not ok:
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
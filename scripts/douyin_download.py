@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 import re
 import sys
 import json
@@ -7,6 +8,13 @@ import time
 import requests
 from urllib.parse import urlparse, parse_qs
 
+# TikHub 客户端（连接池 + 同步外观）放在 douyin-downloader 技能里，三个脚本共用
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "skills", "douyin-downloader", "scripts"))
+from tikhub_client import get_sync_client, set_client_defaults
+from response_cache import default_cache
+from rate_limit import default_limiter
+from video_record import normalize_response
+
 def extract_modal_id(url):
     """从抖音链接中提取modal_id"""
     # 处理短链接
@@ -33,51 +41,49 @@ def extract_modal_id(url):
     
     return None
 
-def download_douyin_video(modal_id, api_token):
-    """使用TikHub API下载抖音视频"""
+async def fetch_douyin_video(client, modal_id):
+    """使用TikHub API获取抖音视频信息（异步版本，client 为 TikHubClient）"""
     if not modal_id:
         print("无法提取视频ID", file=sys.stderr)
         return None
     
-    # TikHub API endpoint
-    api_url = f"https://api.tikhub.io/douyin/video_data?video_id={modal_id}"
-    
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    
     try:
-        response = requests.get(api_url, headers=headers, timeout=30)
-        if response.status_code == 200:
-            data = response.json()
+        response = await client.video_data(modal_id)
+        if response.status == 200:
+            data = response.data or {}
             if data.get('status') == 'success':
-                video_info = data.get('data', {})
-                return {
-                    'title': video_info.get('title', '未知标题'),
-                    'author': video_info.get('author', {}).get('nickname', '未知作者'),
-                    'description': video_info.get('desc', ''),
-                    'cover_url': video_info.get('cover_url', ''),
-                    'video_url': video_info.get('video_url', ''),
-                    'duration': video_info.get('duration', 0),
-                    'create_time': video_info.get('create_time', '')
-                }
+                # 与原来一样接受任何 success 响应，缺的字段用“未知标题”等占位
+                record = normalize_response(data, modal_id, lenient=True)
+                if record is not None:
+                    return record.as_video_info()
+                print("API响应中没有可识别的视频信息", file=sys.stderr)
             else:
                 print(f"API返回错误: {data.get('message', '未知错误')}", file=sys.stderr)
         else:
-            print(f"HTTP错误: {response.status_code}", file=sys.stderr)
+            print(f"HTTP错误: {response.status}", file=sys.stderr)
     except Exception as e:
         print(f"下载失败: {e}", file=sys.stderr)
     
     return None
 
+def download_douyin_video(modal_id, api_token):
+    """使用TikHub API下载抖音视频（同步外观，复用进程内的连接池）"""
+    tikhub = get_sync_client(api_token)
+    return tikhub.run(fetch_douyin_video(tikhub.client, modal_id))
+
 def main():
-    if len(sys.argv) < 3:
-        print("用法: python douyin_download.py <抖音链接或modal_id> <api_token>", file=sys.stderr)
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    flags = set(sys.argv[1:]) - set(args)
+    if len(args) < 2:
+        print("用法: python douyin_download.py <抖音链接或modal_id> <api_token> [--offline] [--no-cache]", file=sys.stderr)
+        print("  --offline   只从本地缓存回答，不请求TikHub", file=sys.stderr)
+        print("  --no-cache  不读写本地缓存", file=sys.stderr)
         sys.exit(1)
     
-    input_arg = sys.argv[1]
-    api_token = sys.argv[2]
+    input_arg = args[0]
+    api_token = args[1]
+    cache = None if '--no-cache' in flags else default_cache()
+    set_client_defaults(cache=cache, offline='--offline' in flags)
     
     # 提取modal_id
     if input_arg.isdigit():
@@ -91,6 +97,11 @@ def main():
     
     # 下载视频信息
     video_info = download_douyin_video(modal_id, api_token)
+    if cache is not None:
+        print(cache.stats_line(), file=sys.stderr)
+    limiter = default_limiter()
+    if limiter is not None and '--offline' not in flags:
+        print(limiter.report_line(), file=sys.stderr)
     
     if video_info:
         print(json.dumps(video_info, ensure_ascii=False, indent=2))
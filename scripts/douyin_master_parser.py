@@ -8,10 +8,30 @@
 import sys
 import os
 import json
-import subprocess
+import time
+import logging
+import asyncio
 import tempfile
 from pathlib import Path
 
+# 元数据阶段直接调用工作区 douyin_download.py（它会把 douyin-downloader 技能的
+# TikHub 客户端加入 sys.path），视频阶段调用 douyin-video-fetch 的 run_batch
+from douyin_download import extract_modal_id, fetch_douyin_video
+from tikhub_client import TikHubClient
+from response_cache import default_cache
+from rate_limit import default_limiter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "skills", "douyin-video-fetch", "scripts"))
+from fetch_video import run_batch
+from resolve_cache import ResolveCache
+
+# fetch_video 导入时把根日志设为 INFO；以前子进程的日志被丢弃，这里只保留警告和错误
+for _name in ("fetch_video", "media_download", "content_store"):
+    logging.getLogger(_name).setLevel(logging.WARNING)
+
+METADATA_TIMEOUT = 30
+VIDEO_TIMEOUT = 60
+
 def extract_video_id(input_str):
     """从输入中提取视频ID"""
     import re
@@ -43,43 +63,62 @@ def get_config_token():
         print(f"警告: 无法读取配置文件 {e}", file=sys.stderr)
         return None
 
-def run_douyin_downloader(video_id, token):
-    """运行douyin-downloader获取元数据"""
+async def run_douyin_downloader(input_arg, video_id, token):
+    """元数据阶段：通过TikHub获取视频信息（douyin_download.fetch_douyin_video），失败返回None"""
     if not token:
         return None
-        
+
     try:
-        result = subprocess.run([
-            'python3', '/root/.openclaw/workspace/scripts/douyin_download.py',
-            video_id, token
-        ], capture_output=True, text=True, timeout=30)
-        
-        if result.returncode == 0:
-            return json.loads(result.stdout)
+        modal_id = video_id if video_id.isdigit() else await asyncio.to_thread(extract_modal_id, input_arg)
+        async with TikHubClient(token, cache=default_cache(), limiter=default_limiter()) as client:
+            video_info = await asyncio.wait_for(fetch_douyin_video(client, modal_id), METADATA_TIMEOUT)
+        if video_info:
+            video_info.setdefault('video_id', modal_id)
+        return video_info
     except Exception as e:
         print(f"douyin-downloader执行失败: {e}", file=sys.stderr)
-    
+
     return None
 
-def run_douyin_video_fetch(input_url, output_dir):
-    """运行douyin-video-fetch下载视频"""
+async def run_douyin_video_fetch(input_url, output_dir):
+    """视频阶段：用douyin-video-fetch的run_batch下载视频，返回它的结果字典（含 ok、output 等字段），失败返回None"""
     try:
-        result = subprocess.run([
-            'python3', '/root/.openclaw/workspace/skills/douyin-video-fetch/fetch_video.py',
-            input_url, '--output-dir', output_dir
-        ], capture_output=True, text=True, timeout=60)
-        
-        if result.returncode == 0:
-            # 解析输出找到下载的文件
-            import re
-            match = re.search(r'\[OK\].*?->\s*(.*?\.mp4)', result.stdout)
-            if match:
-                return match.group(1)
+        cache = ResolveCache()
+    except Exception as e:
+        # 缓存目录不可写等：不用缓存照常下载
+        print(f"douyin-video-fetch解析缓存不可用: {e}", file=sys.stderr)
+        cache = None
+    try:
+        results = await asyncio.wait_for(run_batch([input_url], output_dir, cache=cache), VIDEO_TIMEOUT)
+        return results[0]
     except Exception as e:
         print(f"douyin-video-fetch执行失败: {e}", file=sys.stderr)
-    
+    finally:
+        if cache is not None:
+            cache.close()
+
     return None
 
+async def run_stages(input_arg, video_id, token, output_dir):
+    """两个阶段并发执行，总耗时取决于较慢的一个。返回 (video_info, video_result, timings)"""
+    timings = {}
+
+    async def timed(name, coro):
+        started = time.monotonic()
+        try:
+            return await coro
+        finally:
+            timings[name] = round(time.monotonic() - started, 3)
+
+    video_url = input_arg if input_arg.startswith('http') else f"https://www.douyin.com/video/{video_id}"
+    started = time.monotonic()
+    video_info, video_result = await asyncio.gather(
+        timed('metadata', run_douyin_downloader(input_arg, video_id, token)),
+        timed('video', run_douyin_video_fetch(video_url, output_dir)),
+    )
+    timings['total'] = round(time.monotonic() - started, 3)
+    return video_info, video_result, timings
+
 def generate_comprehensive_summary(video_info, video_path=None):
     """生成综合摘要"""
     summary = {
@@ -110,25 +149,18 @@ def main():
     # 获取API Token
     token = get_config_token()
     
-    # 尝试使用douyin-downloader获取元数据
-    video_info = None
-    if token:
-        video_info = run_douyin_downloader(video_id, token)
-    
     # 创建临时目录用于视频下载
     with tempfile.TemporaryDirectory() as temp_dir:
-        # 尝试使用douyin-video-fetch下载视频
-        video_path = None
-        if input_arg.startswith('http'):
-            video_path = run_douyin_video_fetch(input_arg, temp_dir)
-        else:
-            video_path = run_douyin_video_fetch(f"https://www.douyin.com/video/{video_id}", temp_dir)
+        # 元数据（douyin-downloader）与视频下载（douyin-video-fetch）并发进行
+        video_info, video_result, timings = asyncio.run(run_stages(input_arg, video_id, token, temp_dir))
+        video_path = video_result['output'] if video_result and video_result['ok'] else None
         
         # 生成综合摘要
         if not video_info:
             video_info = {'video_id': video_id}
         
         summary = generate_comprehensive_summary(video_info, video_path)
+        summary['timings'] = timings
         print(json.dumps(summary, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
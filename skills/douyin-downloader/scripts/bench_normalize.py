@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+video_record 规范化器的校验与微基准
+
+对 fixtures/tikhub/ 里的每个响应样本运行 normalize_response，与
+fixtures/tikhub/expected.json 比对，并报告每条耗时（ns）和峰值内存分配，
+同时给出之前各脚本里手写解析代码的耗时作对照：
+
+    parse      json.loads 整段响应。TikHubClient 对每个响应都解析一次（缓存、
+               健康度判断都要用），规范化器直接用这份结果
+    normalize  在已解析的 JSON 上运行 normalize_response
+    legacy     fetch_one_video*: 整段响应 replace("\\/", "/") 后正则找播放地址
+               其他样本:        json.loads + 原 get_douyin_video_info 的链式 .get()
+
+    python scripts/bench_normalize.py            # 校验 + 计时
+    python scripts/bench_normalize.py --check    # 只校验（不一致时退出码 1）
+    python scripts/bench_normalize.py --json
+
+新增样本：把响应保存为 fixtures/tikhub/<name>.json，并在 expected.json
+里按同名写上期望结果（无法识别时为 null）。
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from video_record import PLAY_API_PREFIX, normalize_response
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fixtures", "tikhub")
+MIN_BENCH_SECONDS = 0.2
+_LEGACY_PLAY_URL = re.compile(r'(https://www\.douyin\.com/aweme/v1/play/[^\s"<>\\]+)')
+
+
+def load_corpus(fixture_dir=FIXTURE_DIR):
+    with open(os.path.join(fixture_dir, "expected.json"), "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    corpus = []
+    for name in sorted(expected):
+        with open(os.path.join(fixture_dir, name), "r", encoding="utf-8") as f:
+            corpus.append((name, f.read(), expected[name]))
+    return corpus
+
+
+def describe(record):
+    if record is None:
+        return None
+    found = record.to_dict()
+    del found["play_urls"]
+    found["play_url"] = record.play_url(prefer=PLAY_API_PREFIX)
+    found["bit_rates"] = [bit_rate for bit_rate, _url in record.play_urls]
+    return found
+
+
+def legacy_play_url(text):
+    normalized = text.replace("\\/", "/")
+    m = _LEGACY_PLAY_URL.search(normalized)
+    return m.group(1) if m else None
+
+
+def legacy_video_info(text):
+    data = json.loads(text)
+    if data.get('status') == 'success' or 'data' in data:
+        video_info = data.get('data', {}) if isinstance(data.get('data'), dict) else {}
+        if 'title' in video_info:
+            author = video_info.get('author', {})
+            return {
+                'title': video_info.get('title', '未知标题'),
+                'author': author.get('nickname', '未知作者') if isinstance(author, dict) else author,
+                'description': video_info.get('desc', '') or video_info.get('description', ''),
+                'cover_url': video_info.get('cover_url', '') or video_info.get('cover', ''),
+                'video_url': video_info.get('video_url', '') or video_info.get('play_addr', ''),
+                'duration': video_info.get('duration', 0),
+                'create_time': video_info.get('create_time', '')
+            }
+        elif 'aweme_detail' in video_info:
+            aweme = video_info['aweme_detail']
+            return {
+                'title': aweme.get('desc', '未知标题'),
+                'author': aweme.get('author', {}).get('nickname', '未知作者'),
+                'description': aweme.get('desc', ''),
+                'cover_url': aweme.get('video', {}).get('cover', {}).get('url_list', [''])[0],
+                'video_url': aweme.get('video', {}).get('play_addr', {}).get('url_list', [''])[0],
+                'duration': aweme.get('video', {}).get('duration', 0) // 1000,
+                'create_time': aweme.get('create_time', '')
+            }
+    return None
+
+
+def legacy(name):
+    return legacy_play_url if name.startswith("fetch_one_video") else legacy_video_info
+
+
+def check(corpus):
+    failures = []
+    for name, text, expected in corpus:
+        got = describe(normalize_response(json.loads(text)))
+        if got != expected:
+            failures.append((name, expected, got))
+    return failures
+
+
+def time_call(func, arg):
+    """ns per call, repeating until MIN_BENCH_SECONDS have passed."""
+    runs = 0
+    started = time.perf_counter_ns()
+    deadline = started + MIN_BENCH_SECONDS * 1e9
+    while True:
+        func(arg)
+        runs += 1
+        now = time.perf_counter_ns()
+        if now >= deadline:
+            return (now - started) // runs
+
+
+def peak_allocation(func, arg):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func(arg)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验并测量 TikHub 响应规范化器")
+    parser.add_argument("--check", action="store_true", help="只校验样本，不计时")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check(corpus)
+    report = {
+        "fixtures": len(corpus),
+        "failures": [{"fixture": n, "expected": e, "got": g} for n, e, g in failures],
+        "timings": {},
+    }
+    if not args.check:
+        for name, text, _expected in corpus:
+            old = legacy(name)
+            data = json.loads(text)
+            report["timings"][name] = {
+                "bytes": len(text.encode("utf-8")),
+                "parse_ns": time_call(json.loads, text),
+                "parse_peak_alloc_bytes": peak_allocation(json.loads, text),
+                "normalize_ns": time_call(normalize_response, data),
+                "normalize_peak_alloc_bytes": peak_allocation(normalize_response, data),
+                "legacy": old.__name__,
+                "legacy_ns": time_call(old, text),
+                "legacy_peak_alloc_bytes": peak_allocation(old, text),
+            }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        status = "ok" if not failures else f"{len(failures)} FAILED"
+        print(f"[schema] corpus {status} ({len(corpus)} fixtures)")
+        for f in report["failures"]:
+            print(f"  {f['fixture']}: expected {f['expected']}, got {f['got']}")
+        for name, t in report["timings"].items():
+            print(f"  {name:<30} {t['bytes']:>6} B  parse {t['parse_ns'] / 1000:>7.1f} us {t['parse_peak_alloc_bytes'] / 1024:>6.1f} KiB"
+                  f"  normalize {t['normalize_ns'] / 1000:>6.1f} us {t['normalize_peak_alloc_bytes'] / 1024:>5.1f} KiB"
+                  f"  | {t['legacy']:<17} {t['legacy_ns'] / 1000:>7.1f} us {t['legacy_peak_alloc_bytes'] / 1024:>6.1f} KiB")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,22 @@
 支持 modal_id、抖音链接下载
 """
 
+import argparse
+import hashlib
 import requests
 import json
 import os
 import re
 import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-TIKHUB_VIDEO_URL = "https://api.tikhub.io/api/v1/douyin/web/fetch_one_video"
+from tikhub_client import get_sync_client, set_client_defaults
+from response_cache import default_cache
+from rate_limit import default_limiter
+from video_record import PLAY_API_PREFIX, normalize_response
 
 def load_config():
     """加载配置文件"""
@@ -40,25 +49,19 @@ def extract_modal_id(text):
         return m.group(1)
     return None
 
+def get_video_record(modal_id, token):
+    """通过modal_id获取统一的视频记录（video_record.VideoRecord），响应无法识别时返回 None"""
+    resp = get_sync_client(token).fetch_one_video(modal_id)
+    resp.raise_for_status()
+    return normalize_response(resp.data, modal_id)
+
 def get_video_url_by_modal_id(modal_id, token):
     """通过modal_id获取视频下载链接"""
-    url = f"{TIKHUB_VIDEO_URL}?aweme_id={modal_id}&need_anchor_info=false"
-    headers = {
-        "Authorization": f"Bearer {token}",
-    }
-    
-    resp = requests.get(url, headers=headers, timeout=30)
-    resp.raise_for_status()
-    
-    text = resp.text
-    
-    # 提取第一个以 https://www.douyin.com/aweme/v1/play/ 开头的URL
-    normalized = text.replace("\\/", "/")
-    m = re.search(r'(https://www\.douyin\.com/aweme/v1/play/[^\s"<>\\]+)', normalized)
-    if m:
-        return m.group(1)
-    
-    return None
+    record = get_video_record(modal_id, token)
+    if record is None:
+        return None
+    # 优先 https://www.douyin.com/aweme/v1/play/ 开头的地址（不随CDN签名过期），否则取最高码率
+    return record.play_url(prefer=PLAY_API_PREFIX)
 
 def get_video_info(user_input, token=None):
     """
@@ -88,54 +91,249 @@ def get_video_info(user_input, token=None):
         "video_url": video_url
     }
 
-def download_video(url, output_path=None):
-    """下载视频"""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Referer": "https://www.douyin.com/",
-    }
-    
-    resp = requests.get(url, headers=headers, timeout=60)
-    resp.raise_for_status()
-    
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://www.douyin.com/",
+}
+DOWNLOAD_TIMEOUT = (10, 60)  # (连接, 两次读取之间) 秒
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+
+_thread_local = threading.local()
+
+def _file_mode():
+    """mkstemp 建的临时文件权限是 0600，改名前按 umask 恢复成普通文件的权限。"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+FILE_MODE = _file_mode()
+
+def _session():
+    """每个下载线程一个 requests.Session，同一线程内复用连接。"""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+        session.headers.update(DOWNLOAD_HEADERS)
+    return session
+
+def default_filename(url, modal_id=None):
+    """稳定的文件名：douyin_<modal_id>.mp4；没有 modal_id 时用链接的 SHA-1 前 12 位。"""
+    if modal_id:
+        return f"douyin_{modal_id}.mp4"
+    return f"douyin_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.mp4"
+
+def download_video(url, output_path=None, modal_id=None, output_dir=".", progress=None):
+    """
+    流式下载视频，返回文件路径。
+
+    按 CHUNK_SIZE 分块写入同目录下的临时文件，完成后原子改名为 output_path，
+    内存占用与视频大小无关；失败时删除临时文件，不会留下半截的 .mp4。
+    progress(已下载字节, 总字节或 None) 在每块写入后调用。
+    """
     if not output_path:
-        output_path = f"douyin_{hash(url) % 100000}.mp4"
-    
-    with open(output_path, "wb") as f:
-        f.write(resp.content)
-    
+        output_path = os.path.join(output_dir, default_filename(url, modal_id))
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+
+    with _session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+        resp.raise_for_status()
+        total = int(resp.headers.get("Content-Length") or 0) or None
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=".part", dir=directory)
+        try:
+            done = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, total)
+            if total is not None and done != total:
+                raise IOError(f"下载不完整: {done}/{total} 字节")
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     return output_path
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("""
+def iter_input_lines(stream):
+    """批量输入：每行一个链接或modal_id，忽略空行和 # 开头的注释。"""
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+class _Progress:
+    """批量下载时每个文件每 10%（不知道大小时每 10 MB）打印一行进度。"""
+
+    def __init__(self, label):
+        self.label = label
+        self.step = -1
+
+    def __call__(self, done, total):
+        step = done * 10 // total if total else done // (10 * CHUNK_SIZE)
+        if step == self.step:
+            return
+        self.step = step
+        size = f"{done / CHUNK_SIZE:.1f}/{total / CHUNK_SIZE:.1f} MB ({step * 10}%)" if total else f"{done / CHUNK_SIZE:.1f} MB"
+        print(f"  {self.label} {size}", file=sys.stderr, flush=True)
+
+def _download_one(index, count, modal_id, video_url, output_dir):
+    label = f"[{index}/{count}] {modal_id}"
+    started = time.monotonic()
+    path = download_video(video_url, modal_id=modal_id, output_dir=output_dir, progress=_Progress(label))
+    return path, os.path.getsize(path), time.monotonic() - started
+
+def download_batch(inputs, token=None, output_dir=".", concurrency=DEFAULT_CONCURRENCY, skip_existing=True):
+    """
+    批量下载。inputs 为链接或modal_id 列表，最多 concurrency 个文件同时下载。
+
+    视频地址在主线程里逐个查询（共用 TikHub 同步客户端、缓存和限速），查到
+    一个就交给线程池下载，查询与下载重叠进行；最多提前查好 concurrency 个
+    地址，CDN 签名不会在排队时过期。已存在的 douyin_<modal_id>.mp4 默认跳过。
+    返回每项的结果字典列表（顺序与输入一致）。
+    """
+    token = get_token(token)
+    concurrency = max(1, concurrency)
+    count = len(inputs)
+    results = [None] * count
+    futures = {}
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, raw in enumerate(inputs, 1):
+            result = results[index - 1] = {"input": raw, "modal_id": None, "ok": False}
+            modal_id = result["modal_id"] = extract_modal_id(raw)
+            if not modal_id:
+                result["error"] = "无法从输入中提取modal_id"
+                print(f"[{index}/{count}] ❌ {raw}: {result['error']}", file=sys.stderr)
+                continue
+            path = os.path.join(output_dir, default_filename(None, modal_id))
+            if skip_existing and os.path.exists(path):
+                result.update(ok=True, path=path, bytes=os.path.getsize(path), skipped=True)
+                print(f"[{index}/{count}] {modal_id} 已存在，跳过: {path}", file=sys.stderr)
+                continue
+            slots.acquire()
+            try:
+                video_url = get_video_url_by_modal_id(modal_id, token)
+            except Exception as e:
+                video_url, result["error"] = None, str(e)
+            if not video_url:
+                result.setdefault("error", "无法获取视频链接")
+                print(f"[{index}/{count}] ❌ {modal_id}: {result['error']}", file=sys.stderr)
+                slots.release()
+                continue
+            print(f"[{index}/{count}] ⬇️  {modal_id}", file=sys.stderr)
+            future = pool.submit(_download_one, index, count, modal_id, video_url, output_dir)
+            future.add_done_callback(lambda _f: slots.release())
+            futures[future] = result
+
+        for future in as_completed(futures):
+            result = futures[future]
+            try:
+                path, size, seconds = future.result()
+            except Exception as e:
+                result["error"] = str(e)
+                print(f"❌ {result['modal_id']}: {e}", file=sys.stderr)
+                continue
+            result.update(ok=True, path=path, bytes=size, seconds=round(seconds, 2))
+            print(f"✅ {result['modal_id']}: {path} ({size / CHUNK_SIZE:.1f} MB, {seconds:.1f}s)", file=sys.stderr)
+    return results
+
+def print_summary(results, seconds):
+    ok = [r for r in results if r["ok"]]
+    skipped = sum(1 for r in ok if r.get("skipped"))
+    fetched = sum(r["bytes"] for r in ok if not r.get("skipped"))
+    rate = fetched / CHUNK_SIZE / seconds if seconds > 0 else 0.0
+    print(f"\n共 {len(results)} 个: 成功 {len(ok) - skipped}, 跳过 {skipped}, 失败 {len(results) - len(ok)}; "
+          f"下载 {fetched / CHUNK_SIZE:.1f} MB, 用时 {seconds:.1f}s ({rate:.1f} MB/s)")
+    for r in results:
+        if not r["ok"]:
+            print(f"  ❌ {r['input']}: {r.get('error')}")
+
+USAGE = """
 抖音视频下载器
 =============
 
 用法:
-  python douyin_download.py "抖音链接或modal_id" [--download]
-  加 --download 参数可直接下载视频，否则只返回视频下载url            
+  python douyin_download.py "抖音链接或modal_id" [--download] [--offline] [--no-cache]
+  python douyin_download.py --download --file ids.txt [--concurrency 4] [--output-dir DIR]
+  加 --download 参数可直接下载视频，否则只返回视频下载url
+  --file 批量下载文件里的链接或modal_id（每行一个，- 表示标准输入），最多 --concurrency 个同时下载
+  下载文件名为 douyin_<modal_id>.mp4，批量模式跳过已存在的文件
+  --offline 只从本地缓存回答；--no-cache 不读写本地缓存（默认 ~/.cache/tikhub）
 
 示例:
   python douyin_download.py "https://www.douyin.com/jingxuan?modal_id=7597329042169220398"
   python douyin_download.py "7597329042169220398" --download
+  python douyin_download.py --download --file ids.txt --concurrency 8 --output-dir videos
 
 获取免费Token: https://user.tikhub.io/register?referral_code=JtYTGCqJ
-""")
+"""
+
+def main():
+    parser = argparse.ArgumentParser(usage=USAGE, add_help=False)
+    parser.add_argument("input", nargs="?")
+    parser.add_argument("--download", action="store_true")
+    parser.add_argument("--file")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    if not args.input and not args.file:
+        print(USAGE)
         sys.exit(1)
-    
-    user_input = sys.argv[1]
-    download = "--download" in sys.argv
-    
+
+    cache = None if args.no_cache else default_cache()
+    set_client_defaults(cache=cache, offline=args.offline)
+
+    def print_stats():
+        if cache is not None:
+            print(cache.stats_line(), file=sys.stderr)
+        limiter = default_limiter()
+        if limiter is not None and not args.offline:
+            print(limiter.report_line(), file=sys.stderr)
+
     try:
-        info = get_video_info(user_input)
+        if args.file:
+            if args.file == "-":
+                inputs = list(iter_input_lines(sys.stdin))
+            else:
+                with open(args.file, "r", encoding="utf-8") as f:
+                    inputs = list(iter_input_lines(f))
+            if not args.download:
+                for raw in inputs:
+                    try:
+                        info = get_video_info(raw)
+                        print(f"{info['modal_id']}\t{info['video_url']}")
+                    except Exception as e:
+                        print(f"❌ {raw}: {e}")
+                print_stats()
+                return
+            started = time.monotonic()
+            results = download_batch(inputs, output_dir=args.output_dir, concurrency=args.concurrency)
+            print_stats()
+            print_summary(results, time.monotonic() - started)
+            if results and not any(r["ok"] for r in results):
+                sys.exit(1)
+            return
+
+        info = get_video_info(args.input)
+        print_stats()
         print(f"modal_id: {info['modal_id']}")
         print(f"视频地址: {info['video_url']}")
-        
-        if download:
+
+        if args.download:
             print("\n⬇️  下载中...")
-            path = download_video(info['video_url'])
+            path = download_video(info['video_url'], modal_id=info['modal_id'], output_dir=args.output_dir,
+                                  progress=_Progress(info['modal_id']))
             print(f"✅ 下载完成: {path}")
     except Exception as e:
         print(f"\n❌ 错误: {e}")
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+TikHub 端点健康度与对冲请求
+
+EndpointHealth 为每个端点记录延迟和成功率的滑动平均（EWMA）以及连续失败
+次数，持久化到一个 JSON 文件，下次运行时先尝试最快的健康端点。连续失败达到
+阈值后断路器打开，在 open_seconds 内跳过该端点；到期后放行一次试探请求，
+成功则恢复，失败则再次打开。
+
+hedged_first 按顺序启动请求：前一个在 hedge_delay 秒内没有结果（或已经失败）
+就启动下一个，取第一个有效结果并取消其余请求。
+
+多个进程共用同一个健康文件时按“最后写入者为准”处理，文件只作为排序提示。
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_HEALTH_PATH = os.path.expanduser("~/.openclaw/tikhub_endpoint_health.json")
+DEFAULT_HEDGE_DELAY = 1.5
+FAILURE_THRESHOLD = 3
+OPEN_SECONDS = 60.0
+EWMA_ALPHA = 0.3
+# 没有历史数据的端点按这个延迟估计，保持调用方给出的默认顺序
+PRIOR_LATENCY = 1.0
+MIN_SUCCESS_RATE = 0.05
+SAVE_INTERVAL = 10.0
+
+
+class EndpointHealth:
+    def __init__(self, path=DEFAULT_HEALTH_PATH, failure_threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._stats = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._probing = set()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self._stats = {name: s for name, s in data.items() if isinstance(s, dict)}
+
+    def stats(self, name):
+        return self._stats.setdefault(name, {
+            "latency": PRIOR_LATENCY,
+            "success_rate": 1.0,
+            "consecutive_failures": 0,
+            "open_until": 0.0,
+        })
+
+    def score(self, name):
+        """预计耗时（秒），按成功率放大；越小越好。"""
+        s = self.stats(name)
+        return s["latency"] / max(s["success_rate"], MIN_SUCCESS_RATE)
+
+    def is_open(self, name, now=None):
+        """断路器是否打开。到期后放行一次试探请求（半开），结果出来前其余调用仍然跳过。"""
+        s = self.stats(name)
+        if s["consecutive_failures"] < self.failure_threshold:
+            return False
+        now = time.time() if now is None else now
+        if now < s["open_until"] or name in self._probing:
+            return True
+        self._probing.add(name)
+        return False
+
+    def order(self, names):
+        """
+        可用端点按 score 排序（相同分数保持原顺序）。全部断路时仍返回最早
+        恢复的一个，调用不会因为断路器而完全没有请求可发。
+        """
+        now = time.time()
+        available = [n for n in names if not self.is_open(n, now)]
+        if not available:
+            return [min(names, key=lambda n: self.stats(n)["open_until"])]
+        return sorted(available, key=self.score)
+
+    def _update(self, name, latency, ok):
+        s = self.stats(name)
+        self._probing.discard(name)
+        if latency is not None:
+            s["latency"] = round((1 - EWMA_ALPHA) * s["latency"] + EWMA_ALPHA * latency, 4)
+        s["success_rate"] = round((1 - EWMA_ALPHA) * s["success_rate"] + EWMA_ALPHA * (1.0 if ok else 0.0), 4)
+        if ok:
+            s["consecutive_failures"] = 0
+            s["open_until"] = 0.0
+        else:
+            s["consecutive_failures"] += 1
+            if s["consecutive_failures"] >= self.failure_threshold:
+                s["open_until"] = time.time() + self.open_seconds
+        self._dirty = True
+
+    def record_success(self, name, latency):
+        self._update(name, latency, True)
+
+    def record_failure(self, name, latency=None):
+        self._update(name, latency, False)
+
+    def record_cancelled(self, name, elapsed):
+        """
+        对冲中被取消的请求：已等待的 elapsed 秒是延迟的下限，计入延迟平均
+        （慢端点因此排到后面），成功率不变。
+        """
+        self._probing.discard(name)
+        s = self.stats(name)
+        if elapsed > s["latency"]:
+            s["latency"] = round((1 - EWMA_ALPHA) * s["latency"] + EWMA_ALPHA * elapsed, 4)
+            self._dirty = True
+
+    def release(self, names):
+        """结束一次调用：放行但最终没有发出（或被取消）的试探请求不再占用半开名额。"""
+        self._probing.difference_update(names)
+
+    def save(self, force=False):
+        """原子写入健康文件；非 force 时最多每 SAVE_INTERVAL 秒写一次。"""
+        if not self.path or not self._dirty:
+            return
+        now = time.monotonic()
+        if not force and now - self._saved_at < SAVE_INTERVAL:
+            return
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".endpoint_health-", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._stats, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError:
+            return
+        self._dirty = False
+        self._saved_at = now
+
+
+async def hedged_first(attempts, hedge_delay=DEFAULT_HEDGE_DELAY, on_cancel=None):
+    """
+    attempts 为 (name, 无参协程函数) 列表，协程返回有效结果或 None。
+    按顺序启动：当前请求 hedge_delay 秒内没有完成、或已完成但结果无效时启动
+    下一个；返回第一个有效结果，取消仍在进行的请求（对每个被取消的请求调用
+    on_cancel(name, 已等待秒数)）。全部无效时返回 None。
+    """
+    pending = {}
+    queue = list(attempts)
+
+    def start():
+        name, factory = queue.pop(0)
+        pending[asyncio.ensure_future(factory())] = (name, time.monotonic())
+
+    try:
+        while queue or pending:
+            if queue and (not pending or hedge_delay <= 0):
+                start()
+                if hedge_delay <= 0 and queue:
+                    continue
+            timeout = hedge_delay if queue else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # 当前请求太慢：对冲，启动下一个
+                start()
+                continue
+            for task in done:
+                pending.pop(task)
+                result = None if task.cancelled() or task.exception() else task.result()
+                if result is not None:
+                    return result
+    finally:
+        now = time.monotonic()
+        for task, (name, started) in pending.items():
+            task.cancel()
+            if on_cancel is not None:
+                on_cancel(name, now - started)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return None
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+TikHub 请求的跨进程令牌桶与每日额度
+
+所有使用 tikhub_client.py 的脚本和进程共用一个状态文件（默认
+~/.cache/tikhub/rate_limit.json），每次请求前在 flock 锁内：
+
+- 按 rate（次/秒）补充令牌，桶容量为 burst；
+- 预约一个令牌：令牌不足时余额记为负数，调用方睡眠到轮到自己为止，
+  多个进程因此均匀排队在上限附近，而不是一起突发、一起被 429；
+- 累计当天（UTC）每个端点的请求数，超过 daily_limit 时拒绝请求。
+
+收到 429 时 penalize() 把 Retry-After 写入状态文件，所有进程在此之前暂停。
+
+环境变量 TIKHUB_RATE（次/秒，0 表示不限速）、TIKHUB_BURST、
+TIKHUB_DAILY_LIMIT（0 表示不限）、TIKHUB_RATE_STATE 调整默认值。
+
+    python rate_limit.py            # 打印今天的额度使用情况
+    python rate_limit.py --json
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+DEFAULT_STATE_PATH = os.environ.get("TIKHUB_RATE_STATE") or os.path.expanduser("~/.cache/tikhub/rate_limit.json")
+DEFAULT_RATE = float(os.environ.get("TIKHUB_RATE") or 10)
+DEFAULT_BURST = float(os.environ.get("TIKHUB_BURST") or 0)
+DEFAULT_DAILY_LIMIT = int(os.environ.get("TIKHUB_DAILY_LIMIT") or 0)
+# 429 没有 Retry-After 时的退避秒数（按重试次数翻倍）
+DEFAULT_BACKOFF_SECONDS = 1.0
+MAX_RETRY_AFTER_SECONDS = 300.0
+
+
+class BudgetExhausted(Exception):
+    """今天的请求额度已经用完。"""
+
+
+def utc_day(now=None):
+    return datetime.fromtimestamp(time.time() if now is None else now, timezone.utc).strftime("%Y-%m-%d")
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After 头（秒数或 HTTP 日期）转成等待秒数；无法解析时返回 None。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - (time.time() if now is None else now)
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+class RateLimiter:
+    def __init__(self, path=DEFAULT_STATE_PATH, rate=DEFAULT_RATE, burst=DEFAULT_BURST, daily_limit=DEFAULT_DAILY_LIMIT):
+        self.path = path
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.daily_limit = daily_limit
+        self.waited = 0.0
+        self.throttled = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _update(self, change):
+        """在文件锁内读出状态、调用 change(state, now) 并写回，返回 change 的结果。"""
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()
+                day = utc_day(now)
+                if state.get("day") != day:
+                    state["day"] = day
+                    state["counts"] = {}
+                result = change(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state, ensure_ascii=False))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reserve(self, endpoint):
+        """
+        预约一次请求，返回需要等待的秒数。每日额度用完时抛 BudgetExhausted。
+        """
+        def change(state, now):
+            counts = state["counts"]
+            used = sum(counts.values())
+            if self.daily_limit and used >= self.daily_limit:
+                raise BudgetExhausted(f"今日TikHub请求额度已用完: {used}/{self.daily_limit}")
+            counts[endpoint] = counts.get(endpoint, 0) + 1
+            wait = max(0.0, state.get("blocked_until", 0.0) - now)
+            if self.rate <= 0:
+                return wait
+            # 从 429 暂停结束的时刻开始补充令牌
+            start = now + wait
+            tokens = state.get("tokens", self.burst)
+            updated = state.get("updated", start)
+            tokens = min(self.burst, tokens + max(0.0, start - updated) * self.rate) - 1
+            state["tokens"] = tokens
+            state["updated"] = max(start, updated)
+            return wait + (-tokens / self.rate if tokens < 0 else 0.0)
+
+        return self._update(change)
+
+    async def acquire(self, endpoint):
+        wait = self.reserve(endpoint)
+        if wait > 0:
+            self.throttled += 1
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    def penalize(self, retry_after):
+        """收到 429：所有进程暂停 retry_after 秒，并清空令牌。"""
+        def change(state, now):
+            state["blocked_until"] = max(state.get("blocked_until", 0.0), now + retry_after)
+            state["tokens"] = 0.0
+            state["updated"] = state["blocked_until"]
+            state["rate_limited"] = state.get("rate_limited", 0) + 1
+
+        self._update(change)
+
+    def report(self):
+        """今天（UTC）每个端点的请求数、合计、额度和剩余额度。"""
+        def change(state, now):
+            counts = dict(state["counts"])
+            used = sum(counts.values())
+            return {
+                "day": state["day"],
+                "counts": counts,
+                "used": used,
+                "daily_limit": self.daily_limit,
+                "remaining": max(0, self.daily_limit - used) if self.daily_limit else None,
+                "rate_per_second": self.rate,
+                "rate_limited_total": state.get("rate_limited", 0),
+            }
+
+        return self._update(change)
+
+    def report_line(self):
+        r = self.report()
+        budget = f"{r['used']}/{r['daily_limit']}" if r["daily_limit"] else f"{r['used']}（不限额）"
+        per_endpoint = ", ".join(f"{name.rsplit('/', 1)[-1]} {n}" for name, n in sorted(r["counts"].items()))
+        return (f"TikHub额度: 今日({r['day']} UTC) {budget}" + (f" [{per_endpoint}]" if per_endpoint else "")
+                + f", 本进程限速等待 {self.throttled} 次共 {self.waited:.1f}s")
+
+
+_default_limiter = None
+
+
+def default_limiter():
+    """进程内共用的默认限速器；状态文件不可用时为 None（不限速）。"""
+    global _default_limiter
+    if _default_limiter is None:
+        try:
+            _default_limiter = RateLimiter()
+        except OSError:
+            return None
+    return _default_limiter
+
+
+def main():
+    limiter = RateLimiter()
+    if "--json" in sys.argv:
+        print(json.dumps(limiter.report(), ensure_ascii=False, indent=2))
+    else:
+        print(limiter.report_line())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+TikHub 响应的本地缓存（SQLite），按 端点 + 视频ID 存储
+
+- 新鲜期 ttl 秒内直接返回缓存；
+- 过期后 stale_seconds 秒内仍先返回旧响应，同时在后台重新请求（stale-while-revalidate）；
+- 更旧的条目视为未命中，写入时清理；总大小超过 max_bytes 时按最近使用时间（LRU）淘汰；
+- 离线模式下不论新旧都只从缓存回答。
+
+只缓存 HTTP 200 且是 TikHub 成功响应的内容（tikhub_client.is_success_body），
+错误体不会被缓存后反复重放。所有脚本默认共用
+~/.cache/tikhub/response_cache.sqlite3，可用环境变量 TIKHUB_CACHE_DIR、
+TIKHUB_CACHE_TTL、TIKHUB_CACHE_STALE（秒）调整，TIKHUB_CACHE=0 关闭缓存。
+"""
+
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_DIR = os.environ.get("TIKHUB_CACHE_DIR") or os.path.expanduser("~/.cache/tikhub")
+DEFAULT_TTL_SECONDS = float(os.environ.get("TIKHUB_CACHE_TTL") or 6 * 3600)
+DEFAULT_STALE_SECONDS = float(os.environ.get("TIKHUB_CACHE_STALE") or 24 * 3600)
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+
+class CachedResponse:
+    __slots__ = ("status", "text", "age", "fresh")
+
+    def __init__(self, status, text, age, fresh):
+        self.status = status
+        self.text = text
+        self.age = age
+        self.fresh = fresh
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL_SECONDS, stale_seconds=DEFAULT_STALE_SECONDS,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "response_cache.sqlite3")
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (endpoint, key)
+            )"""
+        )
+        self._db.commit()
+
+    def get(self, endpoint, key, allow_expired=False):
+        """
+        CachedResponse 或 None。fresh 表示仍在 ttl 内；超过 ttl + stale_seconds
+        的条目只在 allow_expired（离线模式）时返回。
+        """
+        now = time.time()
+        row = self._db.execute(
+            "SELECT status, body, fetched_at FROM responses WHERE endpoint = ? AND key = ?", (endpoint, str(key))
+        ).fetchone()
+        age = now - row[2] if row is not None else None
+        if row is None or (age > self.ttl + self.stale_seconds and not allow_expired):
+            self.misses += 1
+            return None
+        self._db.execute("UPDATE responses SET last_used = ? WHERE endpoint = ? AND key = ?", (now, endpoint, str(key)))
+        self._db.commit()
+        fresh = age <= self.ttl
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return CachedResponse(row[0], row[1], age, fresh)
+
+    def put(self, endpoint, key, status, body):
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (endpoint, str(key), status, body, now, now, len(body)),
+        )
+        self._evict(now)
+        self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE fetched_at <= ?", (now - self.ttl - self.stale_seconds,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        old = []
+        for endpoint, key, size in self._db.execute("SELECT endpoint, key, size FROM responses ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            old.append((endpoint, key))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE endpoint = ? AND key = ?", old)
+
+    def stats_line(self):
+        return f"TikHub缓存: 命中 {self.hits}, 过期命中 {self.stale_hits}, 未命中 {self.misses}"
+
+    def close(self):
+        self._db.close()
+
+
+_default_cache = None
+
+
+def default_cache():
+    """进程内共用的默认缓存；TIKHUB_CACHE=0 时为 None。"""
+    global _default_cache
+    if os.environ.get("TIKHUB_CACHE", "1") in ("0", "off", "false", "no"):
+        return None
+    if _default_cache is None:
+        try:
+            _default_cache = ResponseCache()
+        except (OSError, sqlite3.Error):
+            return None
+    return _default_cache
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+TikHub API 客户端（异步 + 同步外观）
+
+所有 TikHub 调用共用一个 aiohttp 会话：连接池保持长连接，同一进程内的
+后续请求不再重复 DNS 解析和 TLS 握手。每次调用可单独指定超时，返回已解析
+的 JSON。
+
+异步用法:
+    async with TikHubClient(token) as client:
+        resp = await client.fetch_one_video(modal_id)
+
+同步用法（现有命令行脚本）:
+    resp = get_sync_client(token).video_data(video_id)
+
+传入 cache（response_cache.ResponseCache）后，video_data / video_detail /
+fetch_one_video 的响应按 端点 + 视频ID 缓存，过期条目先返回再后台刷新；
+offline=True 时只从缓存回答。传入 limiter（rate_limit.RateLimiter）后每次
+网络请求先在跨进程令牌桶里排队；429 按 Retry-After 全局暂停后重试。
+get_sync_client 默认使用 default_cache() 和 default_limiter()。
+
+工作区 scripts/ 下的 douyin_download.py、douyin_content_parser.py 也从这里
+导入本模块。
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import time
+
+import aiohttp
+
+from rate_limit import DEFAULT_BACKOFF_SECONDS, BudgetExhausted, default_limiter, parse_retry_after
+from response_cache import default_cache
+
+# 可用环境变量指向本地替身服务或代理
+TIKHUB_BASE_URL = os.environ.get("TIKHUB_BASE_URL", "https://api.tikhub.io")
+VIDEO_DATA_PATH = "/douyin/video_data"
+VIDEO_DETAIL_PATH = "/douyin/video_detail"
+FETCH_ONE_VIDEO_PATH = "/api/v1/douyin/web/fetch_one_video"
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_LIMIT = 16
+KEEPALIVE_SECONDS = 60
+DNS_CACHE_SECONDS = 300
+RATE_LIMIT_RETRIES = 3
+
+
+class TikHubError(Exception):
+    """请求失败（网络错误、超时或非 2xx 状态）。status 为 None 表示没有拿到响应。"""
+
+    def __init__(self, message, status=None, response=None):
+        super().__init__(message)
+        self.status = status
+        self.response = response
+
+
+class TikHubBudgetError(TikHubError):
+    """今天的请求额度已用完，请求没有发出；与端点是否健康无关。"""
+
+
+class TikHubResponse:
+    """
+    一次调用的结果：状态码、原始文本、解析后的 JSON（非 JSON 时为 None）和耗时。
+    from_cache 表示来自本地缓存（此时 elapsed 为 0）。
+    """
+
+    __slots__ = ("url", "status", "headers", "text", "data", "elapsed", "from_cache")
+
+    def __init__(self, url, status, headers, text, elapsed, from_cache=False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.text = text
+        self.elapsed = elapsed
+        self.from_cache = from_cache
+        try:
+            self.data = json.loads(text) if text else None
+        except ValueError:
+            self.data = None
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise TikHubError(f"HTTP错误: {self.status}", status=self.status, response=self)
+        return self
+
+
+class TikHubClient:
+    """
+    异步 TikHub 客户端。会话在第一次请求时创建，绑定到当时的事件循环；
+    用完调用 close()，或用 async with 管理。
+    """
+
+    def __init__(self, token, base_url=TIKHUB_BASE_URL, timeout=DEFAULT_TIMEOUT, pool_limit=DEFAULT_POOL_LIMIT,
+                 cache=None, offline=False, limiter=None):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_limit = pool_limit
+        self.cache = cache
+        self.offline = offline
+        self.limiter = limiter
+        self._session = None
+        self._revalidating = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                keepalive_timeout=KEEPALIVE_SECONDS,
+                ttl_dns_cache=DNS_CACHE_SECONDS,
+            )
+            headers = {"User-Agent": USER_AGENT}
+            if self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            self._session = aiohttp.ClientSession(connector=connector, headers=headers)
+        return self._session
+
+    async def close(self):
+        # 先等后台刷新写回缓存，再关闭连接
+        if self._revalidating:
+            await asyncio.gather(*self._revalidating.values(), return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get(self, path, params=None, timeout=None):
+        """
+        GET base_url + path。网络错误、超时和每日额度用完抛 TikHubError(status=None)；
+        其余 HTTP 状态都返回 TikHubResponse，由调用方决定如何处理。429 先按
+        Retry-After 等待并重试 RATE_LIMIT_RETRIES 次。超时只计请求本身，不含排队。
+        """
+        url = self.base_url + path
+        limit = aiohttp.ClientTimeout(total=timeout if timeout is not None else self.timeout)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            if self.limiter is not None:
+                try:
+                    await self.limiter.acquire(path)
+                except BudgetExhausted as e:
+                    raise TikHubBudgetError(str(e)) from None
+            started = time.monotonic()
+            try:
+                async with self._get_session().get(url, params=params, timeout=limit) as resp:
+                    text = await resp.text()
+                    response = TikHubResponse(str(resp.url), resp.status, dict(resp.headers), text, time.monotonic() - started)
+            except asyncio.TimeoutError:
+                raise TikHubError(f"请求超时: {url}") from None
+            except aiohttp.ClientError as e:
+                raise TikHubError(f"请求失败: {e}") from e
+            if response.status != 429 or attempt == RATE_LIMIT_RETRIES:
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is None:
+                retry_after = DEFAULT_BACKOFF_SECONDS * 2 ** attempt
+            if self.limiter is not None:
+                self.limiter.penalize(retry_after)
+            else:
+                await asyncio.sleep(retry_after)
+        return response
+
+    async def _fetch_and_store(self, path, key, params, timeout):
+        response = await self.get(path, params, timeout)
+        if self.cache is not None and response.status == 200 and is_success_body(response.data):
+            self.cache.put(path, key, response.status, response.text)
+        return response
+
+    def _revalidate(self, path, key, params, timeout):
+        """后台刷新一条过期缓存；同一条目同时只刷新一次，失败时保留旧响应。"""
+        if (path, key) in self._revalidating:
+            return
+        task = asyncio.ensure_future(self._fetch_and_store(path, key, params, timeout))
+        self._revalidating[(path, key)] = task
+        task.add_done_callback(lambda t: (self._revalidating.pop((path, key), None), t.cancelled() or t.exception()))
+
+    async def get_cached(self, path, key, params, timeout=None):
+        """按 (path, key) 走缓存的 GET；离线模式下缓存里没有时抛 TikHubError。"""
+        if self.cache is not None:
+            hit = self.cache.get(path, key, allow_expired=self.offline)
+            if hit is not None:
+                if not hit.fresh and not self.offline:
+                    self._revalidate(path, key, params, timeout)
+                return TikHubResponse(self.base_url + path, hit.status, {}, hit.text, 0.0, from_cache=True)
+        if self.offline:
+            raise TikHubError(f"离线模式: 缓存中没有 {path} {key}")
+        return await self._fetch_and_store(path, key, params, timeout)
+
+    async def video_data(self, video_id, timeout=None):
+        return await self.get_cached(VIDEO_DATA_PATH, video_id, {"video_id": video_id}, timeout)
+
+    async def video_detail(self, video_id, timeout=None):
+        return await self.get_cached(VIDEO_DETAIL_PATH, video_id, {"video_id": video_id}, timeout)
+
+    async def fetch_one_video(self, aweme_id, timeout=None):
+        return await self.get_cached(FETCH_ONE_VIDEO_PATH, aweme_id, {"aweme_id": aweme_id, "need_anchor_info": "false"}, timeout)
+
+
+def is_success_body(body):
+    """
+    TikHub 的成功响应：有非空的 data 对象，且 status（若有）为 "success"、
+    code（若有）为 200。HTTP 200 的错误体（{"code": 400, "data": null}）不算。
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("data"), dict) or not body["data"]:
+        return False
+    if "status" in body:
+        return body["status"] == "success"
+    if "code" in body:
+        return body["code"] == 200
+    return True
+
+
+class SyncTikHubClient:
+    """
+    TikHubClient 的同步外观：自带一个私有事件循环，连接池在多次调用之间保持。
+    不能在正在运行的事件循环里使用（那种场景请直接用 TikHubClient）。
+    """
+
+    def __init__(self, token, **options):
+        self._loop = asyncio.new_event_loop()
+        self.client = TikHubClient(token, **options)
+
+    def run(self, coro):
+        """在私有循环上运行一个协程（可以是使用 self.client 的任意协程）。"""
+        return self._loop.run_until_complete(coro)
+
+    def get(self, path, params=None, timeout=None):
+        return self.run(self.client.get(path, params, timeout))
+
+    def video_data(self, video_id, timeout=None):
+        return self.run(self.client.video_data(video_id, timeout))
+
+    def video_detail(self, video_id, timeout=None):
+        return self.run(self.client.video_detail(video_id, timeout))
+
+    def fetch_one_video(self, aweme_id, timeout=None):
+        return self.run(self.client.fetch_one_video(aweme_id, timeout))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self.run(self.client.close())
+        self._loop.close()
+
+
+_sync_clients = {}
+_client_defaults = {}
+
+
+def set_client_defaults(**options):
+    """设置 get_sync_client 的默认选项（例如命令行的 offline=True、cache=None 或 limiter）。"""
+    _client_defaults.update(options)
+
+
+def get_sync_client(token, **options):
+    """
+    按 token 复用的进程级同步客户端，同一进程内所有调用共享连接池。
+    未指定 cache、limiter 时使用 default_cache()、default_limiter()。
+    """
+    options = {**_client_defaults, **options}
+    if "cache" not in options:
+        options["cache"] = default_cache()
+    if "limiter" not in options:
+        options["limiter"] = default_limiter()
+    key = (token, tuple(sorted(options.items(), key=lambda item: item[0])))
+    client = _sync_clients.get(key)
+    if client is None or client._loop.is_closed():
+        client = _sync_clients[key] = SyncTikHubClient(token, **options)
+    return client
+
+
+def close_sync_clients():
+    while _sync_clients:
+        _key, client = _sync_clients.popitem()
+        client.close()
+
+
+atexit.register(close_sync_clients)
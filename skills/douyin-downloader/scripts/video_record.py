@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+TikHub 响应的统一视频记录
+
+video_data、video_detail、fetch_one_video 的响应有三种形态：
+
+    flat     {"status": "success", "data": {"title", "author": {"nickname"}, "desc",
+              "cover_url", "video_url", "duration"(秒), "create_time"}}
+             （lenient=True 时，status 为 "success" 的 data 即使没有 title 也按 flat 处理）
+    title    video_detail 的变体: "description"、"cover"、"play_addr" 代替上面的字段
+             （与 flat 共用一个 schema，靠候选路径覆盖）
+    aweme    {"data": {"aweme_detail": {...}}}（抖音原生结构，duration 为毫秒，
+              多码率在 video.bit_rate[]）
+
+normalize_response 按 SCHEMAS 里每个字段的候选路径直接在已解析的 JSON 上
+取值，一次得到 VideoRecord，不复制整段响应文本、不生成中间字典。所有脚本从
+这里取字段，输出保持一致。
+
+bench_normalize.py 用 fixtures/tikhub/ 里的响应样本校验并计时。
+"""
+
+PLAY_API_PREFIX = "https://www.douyin.com/aweme/v1/play/"
+UNKNOWN_TITLE = "未知标题"
+UNKNOWN_AUTHOR = "未知作者"
+
+
+def _ms_to_seconds(value):
+    return int(value) // 1000 if isinstance(value, (int, float)) else value
+
+
+def _url(value):
+    """字符串 URL，或 {"url_list": [...]} 里的第一个 http 地址。"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        for url in value.get("url_list") or ():
+            if isinstance(url, str) and url.startswith("http"):
+                return url
+    return None
+
+
+# 字段 -> 候选路径（按顺序取第一个非空值）和可选的转换函数
+SCHEMAS = {
+    "flat": {
+        "id": ((("aweme_id",), ("video_id",), ("id",)), str),
+        "title": ((("title",),), None),
+        "author": ((("author", "nickname"), ("author",), ("nickname",)), None),
+        "desc": ((("desc",), ("description",)), None),
+        "duration": ((("duration",),), None),
+        "cover": ((("cover_url",), ("cover",)), _url),
+        "play": ((("video_url",), ("play_addr",)), _url),
+        "create_time": ((("create_time",),), None),
+    },
+    "aweme": {
+        "id": ((("aweme_id",),), str),
+        "title": ((("desc",),), None),
+        "author": ((("author", "nickname"),), None),
+        "desc": ((("desc",),), None),
+        "duration": ((("video", "duration"), ("duration",)), _ms_to_seconds),
+        "cover": ((("video", "cover"), ("video", "origin_cover")), _url),
+        "play": ((("video", "play_addr"),), None),
+        "create_time": ((("create_time",),), None),
+    },
+}
+
+
+def _lookup(node, path):
+    for key in path:
+        if not isinstance(node, dict):
+            return None
+        node = node.get(key)
+    return node
+
+
+_EMPTY = (None, "", {}, [])
+
+
+def _pick(node, field):
+    paths, convert = field
+    for path in paths:
+        value = node.get(path[0])
+        if len(path) > 1:
+            value = _lookup(value, path[1:])
+        if value not in _EMPTY:
+            return convert(value) if convert is not None else value
+    return None
+
+
+class VideoRecord:
+    """
+    一个视频的统一字段。play_urls 为 (bit_rate, url) 元组，按码率从高到低；
+    码率未知的地址记为 0。duration 单位为秒。
+    """
+
+    __slots__ = ("id", "title", "author", "desc", "duration", "cover", "play_urls", "create_time")
+
+    def __init__(self, id=None, title=None, author=None, desc=None, duration=None, cover=None, play_urls=(), create_time=None):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.desc = desc
+        self.duration = duration
+        self.cover = cover
+        self.play_urls = tuple(play_urls)
+        self.create_time = create_time
+
+    def play_url(self, prefer=None):
+        """码率最高的播放地址；prefer 为前缀时优先返回以它开头的地址。"""
+        if prefer:
+            for _bit_rate, url in self.play_urls:
+                if url.startswith(prefer):
+                    return url
+        return self.play_urls[0][1] if self.play_urls else None
+
+    def as_video_info(self):
+        """douyin_download.py / douyin_content_parser.py 一直输出的视频信息字典。"""
+        return {
+            "title": self.title or UNKNOWN_TITLE,
+            "author": self.author or UNKNOWN_AUTHOR,
+            "description": self.desc or "",
+            "cover_url": self.cover or "",
+            "video_url": self.play_url() or "",
+            "duration": self.duration or 0,
+            "create_time": self.create_time or "",
+        }
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "author": self.author,
+            "desc": self.desc,
+            "duration": self.duration,
+            "cover": self.cover,
+            "play_urls": [{"bit_rate": b, "url": u} for b, u in self.play_urls],
+            "create_time": self.create_time,
+        }
+
+
+def _aweme_play_urls(aweme, default_addr):
+    urls = []
+    seen = set()
+    video = aweme.get("video") if isinstance(aweme.get("video"), dict) else {}
+    variants = [(v.get("bit_rate") or 0, v.get("play_addr")) for v in video.get("bit_rate") or () if isinstance(v, dict)]
+    variants.sort(key=lambda v: v[0], reverse=True)
+    variants.append((0, default_addr))
+    for bit_rate, addr in variants:
+        if not isinstance(addr, dict):
+            continue
+        for url in addr.get("url_list") or ():
+            if isinstance(url, str) and url.startswith("http") and url not in seen:
+                seen.add(url)
+                urls.append((bit_rate, url))
+    return urls
+
+
+def _build(node, shape, video_id):
+    record = VideoRecord()
+    play = None
+    for name, field in SCHEMAS[shape].items():
+        if name == "play":
+            play = _pick(node, field)
+        else:
+            setattr(record, name, _pick(node, field))
+    if shape == "aweme":
+        record.play_urls = tuple(_aweme_play_urls(node, play))
+    elif isinstance(play, str):
+        record.play_urls = ((0, play),)
+    if isinstance(record.author, dict):
+        record.author = record.author.get("nickname")
+    if record.id is None and video_id is not None:
+        record.id = str(video_id)
+    return record
+
+
+def detect_shape(body, lenient=False):
+    """
+    (形态, 记录所在的节点)，无法识别时返回 (None, None)。lenient 时任何
+    status == "success" 的 data 对象都按 flat 处理（douyin_download.py 一直如此，
+    缺的字段用占位值）；默认要求有 title，其余的交给调用方换下一个端点。
+    """
+    if not isinstance(body, dict):
+        return None, None
+    data = body.get("data")
+    if isinstance(data, dict):
+        if isinstance(data.get("aweme_detail"), dict):
+            return "aweme", data["aweme_detail"]
+        if "title" in data or (lenient and body.get("status") == "success"):
+            return "flat", data
+    if isinstance(body.get("aweme_detail"), dict):
+        return "aweme", body["aweme_detail"]
+    return None, None
+
+
+def normalize_response(body, video_id=None, lenient=False):
+    """
+    已解析的 TikHub 响应 -> VideoRecord，无法识别时返回 None。响应里没有
+    视频ID（flat 形态常见）时 id 取请求用的 video_id。lenient 见 detect_shape。
+    """
+    shape, node = detect_shape(body, lenient)
+    if shape is None:
+        return None
+    return _build(node, shape, video_id)
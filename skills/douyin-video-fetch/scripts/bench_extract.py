@@ -0,0 +1,125 @@
+"""
+Correctness check and micro-benchmark for the HTML extractors.
+
+Runs every engine in extractors.ENGINES over the fixture corpus in
+fixtures/extract/, compares the result with fixtures/extract/expected.json
+and reports ns per extraction and peak allocated memory per extraction.
+
+    python scripts/bench_extract.py                 # check + benchmark
+    python scripts/bench_extract.py --check         # correctness only (exit 1 on mismatch)
+    python scripts/bench_extract.py --pad-kb 2048   # inflate pages to multi-MB sizes
+
+Add a fixture by saving the page as fixtures/extract/<name>.html and its
+expected outcome ({"kind", "src"} or {"kind", "aweme_id"}, or null when
+nothing should be found) under the same name in expected.json.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from extractors import ENGINES, extract_html
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fixtures", "extract")
+MIN_BENCH_SECONDS = 0.2
+
+
+def load_corpus(fixture_dir=FIXTURE_DIR, pad_kb=0):
+    with open(os.path.join(fixture_dir, "expected.json"), "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    # Unrelated script placed before the blobs, as on real pages.
+    padding = "<script>/*" + "x" * (pad_kb * 1024) + "*/</script>" if pad_kb else ""
+    corpus = []
+    for name in sorted(expected):
+        with open(os.path.join(fixture_dir, name), "r", encoding="utf-8") as f:
+            html = f.read()
+        if padding:
+            html = html.replace("<head>", "<head>" + padding, 1)
+        corpus.append((name, html, expected[name]))
+    return corpus
+
+
+def describe(found):
+    if found is None:
+        return None
+    if found.src:
+        return {"kind": found.kind, "src": found.src}
+    return {"kind": found.kind, "aweme_id": found.detail["aweme_detail"].get("aweme_id")}
+
+
+def check(corpus, engine):
+    failures = []
+    for name, html, expected in corpus:
+        got = describe(extract_html(html, engine))
+        if got != expected:
+            failures.append((name, expected, got))
+    return failures
+
+
+def time_extraction(html, engine):
+    """ns per extraction, repeating until MIN_BENCH_SECONDS have passed."""
+    runs = 0
+    started = time.perf_counter_ns()
+    deadline = started + MIN_BENCH_SECONDS * 1e9
+    while True:
+        extract_html(html, engine)
+        runs += 1
+        now = time.perf_counter_ns()
+        if now >= deadline:
+            return (now - started) // runs
+
+
+def peak_allocation(html, engine):
+    """Peak bytes allocated while extracting once."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        extract_html(html, engine)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the Douyin HTML extractors")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES), help="Engine(s) to run (default: all)")
+    parser.add_argument("--pad-kb", type=int, default=0, help="Extra unrelated script (KB) inserted into every page")
+    parser.add_argument("--check", action="store_true", help="Only verify the corpus, no timing")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    engines = args.engine or sorted(ENGINES)
+    corpus = load_corpus(pad_kb=args.pad_kb)
+    report = {"fixtures": len(corpus), "engines": {}}
+    failed = False
+    for engine in engines:
+        failures = check(corpus, engine)
+        failed = failed or bool(failures)
+        entry = {"failures": [{"fixture": n, "expected": e, "got": g} for n, e, g in failures], "fixtures": {}}
+        if not args.check:
+            for name, html, _expected in corpus:
+                entry["fixtures"][name] = {
+                    "bytes": len(html),
+                    "ns": time_extraction(html, engine),
+                    "peak_alloc_bytes": peak_allocation(html, engine),
+                }
+        report["engines"][engine] = entry
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for engine, entry in report["engines"].items():
+            status = "ok" if not entry["failures"] else f"{len(entry['failures'])} FAILED"
+            print(f"[{engine}] corpus {status}")
+            for f in entry["failures"]:
+                print(f"  {f['fixture']}: expected {f['expected']}, got {f['got']}")
+            for name, stats in entry["fixtures"].items():
+                print(f"  {name:<32} {stats['bytes']:>9} B {stats['ns'] / 1000:>10.1f} us/extraction {stats['peak_alloc_bytes'] / 1024:>9.1f} KiB peak")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
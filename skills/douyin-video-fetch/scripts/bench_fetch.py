@@ -0,0 +1,177 @@
+"""
+Offline benchmark for fetch_video.py.
+
+Starts standin_server.py in a child process and runs fetch_video.run_batch
+against it, so a release can be compared with the previous one on any
+machine without network access. Each run uses a fresh output directory and
+reports items/sec, per-item latency percentiles, tiers and peak RSS (the
+fetcher itself and the browser processes, the stand-in server excluded).
+
+    python scripts/bench_fetch.py --items 200 --concurrency 8 --repeat 3
+    python scripts/bench_fetch.py --waf-ratio 0.2 --waf-delay 1.5 --bandwidth-mbps 80 --json
+
+Items challenged by the stand-in's WAF page go through the browser tier and
+need Chromium (`playwright install chromium`); with --waf-ratio 0 the HTTP
+fast path serves everything.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from fetch_video import DEFAULT_CONNECTIONS, _percentile, run_batch, stage_summary
+from process_memory import process_rss_mb
+from resolve_cache import ResolveCache
+from standin_server import add_server_arguments, config_from_args, serve
+
+FIRST_VIDEO_ID = 7600000000000000000
+RSS_SAMPLE_SECONDS = 0.25
+SERVER_START_SECONDS = 15
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(config):
+    port = _free_port()
+    process = multiprocessing.Process(target=serve, args=(config, "127.0.0.1", port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f"stand-in server did not start on port {port}")
+
+
+async def run_once(urls, args, server_pid):
+    output_dir = tempfile.mkdtemp(prefix="douyin-bench-")
+    cache = ResolveCache(os.path.join(output_dir, ".cache")) if args.cache else None
+    peak = {"rss_mb": 0.0, "browser_rss_mb": 0.0}
+    done = asyncio.Event()
+
+    async def sample_rss():
+        while not done.is_set():
+            own, children = process_rss_mb(exclude={server_pid})
+            peak["rss_mb"] = max(peak["rss_mb"], own)
+            peak["browser_rss_mb"] = max(peak["browser_rss_mb"], children)
+            try:
+                await asyncio.wait_for(done.wait(), RSS_SAMPLE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.monotonic()
+    try:
+        results = await run_batch(
+            urls, output_dir, concurrency=args.concurrency, connections=args.connections,
+            fast_path=not args.no_fast_path, cache=cache, low_memory=args.low_memory,
+        )
+    finally:
+        elapsed = time.monotonic() - started
+        done.set()
+        await sampler
+        if cache is not None:
+            cache.close()
+        if args.keep_output:
+            print(f"output kept in {output_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    latencies = sorted((r.get("timings") or {}).get("total", 0.0) for r in results)
+    ok = sum(1 for r in results if r["ok"])
+    downloaded = sum(r.get("bytes", 0) for r in results)
+    return {
+        "items": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "seconds": round(elapsed, 3),
+        "items_per_sec": round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mb_per_s": round(downloaded / (1024 * 1024) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": {
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1],
+        } if latencies else {},
+        "tiers": dict(Counter(r.get("tier") or "failed" for r in results)),
+        "errors": dict(Counter(r["error"] for r in results if r["error"])),
+        "peak_rss_mb": peak["rss_mb"],
+        "peak_browser_rss_mb": peak["browser_rss_mb"],
+        "stages": stage_summary(results)["stages"],
+    }
+
+
+async def run_benchmark(args, base_url, server_pid):
+    urls = [f"{base_url}/video/{FIRST_VIDEO_ID + i}" for i in range(args.items)]
+    runs = []
+    for index in range(args.repeat):
+        run = await run_once(urls, args, server_pid)
+        runs.append(run)
+        if not args.json:
+            lat = run["latency"]
+            print(
+                f"run {index + 1}/{args.repeat}: {run['ok']}/{run['items']} ok in {run['seconds']:.2f}s, "
+                f"{run['items_per_sec']} items/s, {run['mb_per_s']} MB/s, "
+                f"latency p50={lat.get('p50', 0):.3f}s p95={lat.get('p95', 0):.3f}s p99={lat.get('p99', 0):.3f}s, "
+                f"peak RSS {run['peak_rss_mb']} MB (+{run['peak_browser_rss_mb']} MB browser), tiers {run['tiers']}"
+            )
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fetch_video against a local Douyin stand-in")
+    parser.add_argument("--items", type=int, default=50, help="Videos per batch")
+    parser.add_argument("--concurrency", type=int, default=4, help="run_batch concurrency")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, help="Ranged connections per media file")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of batches to run")
+    parser.add_argument("--no-fast-path", action="store_true", help="Send every item through the browser tier")
+    parser.add_argument("--cache", action="store_true", help="Use a (per-run, initially empty) resolution cache")
+    parser.add_argument("--low-memory", action="store_true", help="Launch Chromium with fetch_video's --low-memory flags")
+    parser.add_argument("--keep-output", action="store_true", help="Keep each run's output directory")
+    parser.add_argument("--min-items-per-sec", type=float, default=0.0, help="Exit with status 1 when the median run is slower than this")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(config_from_args(args))
+    try:
+        runs = asyncio.run(run_benchmark(args, base_url, server.pid))
+    finally:
+        server.terminate()
+        server.join()
+
+    median = statistics.median(r["items_per_sec"] for r in runs)
+    report = {
+        "items": args.items,
+        "concurrency": args.concurrency,
+        "median_items_per_sec": median,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "runs": runs,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"median {median} items/s over {len(runs)} runs, max fetcher RSS {report['max_rss_mb']} MB")
+    if args.min_items_per_sec and median < args.min_items_per_sec:
+        print(f"median {median} items/s is below --min-items-per-sec {args.min_items_per_sec}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
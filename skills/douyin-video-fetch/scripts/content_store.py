@@ -0,0 +1,55 @@
+"""
+Content-addressed media store used by media_download.py.
+
+Every finished file is hardlinked into `<root>/<sha256[:2]>/<sha256>.mp4`.
+When the same bytes were already stored (a repost under another video_id),
+`<video_id>.mp4` is replaced by a hardlink to the stored object, so each
+distinct video occupies disk space once however many IDs point at it.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STORE_DIRNAME = ".objects"
+
+
+def default_store_dir(output_path):
+    """Store next to the output file, so hardlinks stay on one filesystem."""
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), STORE_DIRNAME)
+
+
+class ContentStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest + ".mp4")
+
+    def adopt(self, path, digest):
+        """
+        Link `path` with the stored object for `digest` and return the number of
+        bytes deduplicated (0 when these bytes are stored for the first time).
+        """
+        obj = self.path_for(digest)
+        try:
+            if os.path.exists(obj):
+                if os.path.samefile(obj, path):
+                    return 0
+                size = os.path.getsize(path)
+                tmp_path = path + ".link"
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                os.link(obj, tmp_path)
+                os.replace(tmp_path, path)
+                logger.info(f"{path} has the same content as {obj}, linked instead of stored again")
+                return size
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            try:
+                os.link(path, obj)
+            except FileExistsError:
+                # Another worker stored the same bytes in the meantime.
+                return self.adopt(path, digest)
+        except OSError as e:
+            logger.warning(f"Content store unavailable for {path}: {e}")
+        return 0
@@ -0,0 +1,239 @@
+"""
+Named extractors that pull the play URL / aweme_detail out of a Douyin video
+page's HTML, used by fetch_video.py when the network listeners did not catch
+aweme/detail.
+
+Each extractor takes the page HTML and returns an Extraction or None. They
+are grouped into engines, tried in order:
+
+    regex  the original implementation: DOTALL regexes over the whole page, a
+           full json.loads of the blob and a recursive search of the tree
+    scan   locates each script tag once with str.find, decodes only from the
+           first "aweme_detail" key onwards with a raw JSON decode, and falls
+           back to an iterative tree search that stops at the first hit
+
+bench_extract.py checks every engine against the fixture corpus in
+fixtures/extract/ and reports ns per extraction and allocated memory.
+"""
+import json
+import re
+from urllib.parse import unquote
+
+EXTRACTORS = {}
+ENGINES = {
+    "regex": ["sigi_state_regex", "render_data_regex"],
+    "scan": ["sigi_state", "render_data"],
+}
+DEFAULT_ENGINE = "scan"
+
+_DETAIL_KEY = '"aweme_detail"'
+_QUOTED_DETAIL_KEY = "%22aweme_detail%22"
+_json_decoder = json.JSONDecoder()
+_INLINE_RENDER_DATA = re.compile(r"RENDER_DATA=([^&]+)&")
+
+
+class Extraction:
+    """
+    What an extractor found: a play `src` (SIGI_STATE) or an aweme/detail
+    shaped `detail` dict ({"aweme_detail": {...}}, RENDER_DATA). `kind` is the
+    data source reported in fetch results.
+    """
+
+    __slots__ = ("kind", "src", "detail")
+
+    def __init__(self, kind, src=None, detail=None):
+        self.kind = kind
+        self.src = src
+        self.detail = detail
+
+
+def register(name):
+    def decorator(func):
+        EXTRACTORS[name] = func
+        return func
+    return decorator
+
+
+def extract_html(html, engine=DEFAULT_ENGINE):
+    """First Extraction produced by the engine's extractors, or None."""
+    if not html:
+        return None
+    for name in ENGINES[engine]:
+        try:
+            found = EXTRACTORS[name](html)
+        except Exception:
+            found = None
+        if found is not None:
+            return found
+    return None
+
+
+def first_http_url(urls):
+    if not isinstance(urls, list):
+        return None
+    for url in urls:
+        if isinstance(url, str) and url.startswith("http"):
+            return url
+    return None
+
+
+def src_from_sigi_state(state):
+    """
+    Extract play URL from Douyin's SIGI_STATE blob (if present in HTML).
+    Structure varies; we try common shapes.
+    """
+    if not isinstance(state, dict):
+        return None
+
+    # We don't have video_id constraint here easily, so we take the first valid video src we find.
+    # Since we are loading a specific video page, there should be one main video.
+    item_module = state.get("ItemModule") or state.get("itemModule") or {}
+    if isinstance(item_module, dict):
+        for _k, v in item_module.items():
+            if not isinstance(v, dict):
+                continue
+            video = v.get("video") or {}
+            if not isinstance(video, dict):
+                continue
+            # Try common fields.
+            for key in ["playAddr", "play_addr", "downloadAddr", "download_addr"]:
+                addr = video.get(key)
+                if isinstance(addr, dict):
+                    src = first_http_url(addr.get("urlList") or addr.get("url_list") or [])
+                    if src:
+                        return src
+    return None
+
+
+# --- regex engine ---------------------------------------------------------
+
+def deep_find_aweme_detail(obj):
+    """
+    Best-effort deep search for a dict that looks like {"aweme_detail": {...}}.
+    """
+    if isinstance(obj, dict):
+        if "aweme_detail" in obj and isinstance(obj.get("aweme_detail"), dict):
+            return obj
+        for v in obj.values():
+            found = deep_find_aweme_detail(v)
+            if found:
+                return found
+    elif isinstance(obj, list):
+        for it in obj:
+            found = deep_find_aweme_detail(it)
+            if found:
+                return found
+    return None
+
+
+@register("sigi_state_regex")
+def sigi_state_regex(html):
+    m = re.search(r'<script[^>]+id="SIGI_STATE"[^>]*>(.*?)</script>', html, re.S)
+    if not m:
+        return None
+    src = src_from_sigi_state(json.loads(m.group(1)))
+    return Extraction("sigi_state", src=src) if src else None
+
+
+@register("render_data_regex")
+def render_data_regex(html):
+    # RENDER_DATA urlencoded JSON lives in its own script tag, or sometimes appears as query-like "RENDER_DATA=..."
+    m = re.search(r'<script[^>]+id="RENDER_DATA"[^>]*>(.*?)</script>', html, re.S) or re.search(r"RENDER_DATA=([^&]+)&", html)
+    if not m:
+        return None
+    found = deep_find_aweme_detail(json.loads(unquote(m.group(1))))
+    return Extraction("render_data", detail=found) if found else None
+
+
+# --- scan engine ----------------------------------------------------------
+
+def script_body(html, script_id):
+    """Text of <script id="script_id">, located with two bounded find() calls."""
+    at = html.find(f'id="{script_id}"')
+    if at < 0:
+        return None
+    start = html.find(">", at)
+    if start < 0:
+        return None
+    end = html.find("</script>", start)
+    return html[start + 1:end] if end >= 0 else None
+
+
+def iter_find_aweme_detail(obj):
+    """Iterative deep_find_aweme_detail: no recursion, stops at the first hit."""
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get("aweme_detail"), dict):
+                return node
+            stack.extend(v for v in reversed(list(node.values())) if isinstance(v, (dict, list)))
+        elif isinstance(node, list):
+            stack.extend(v for v in reversed(node) if isinstance(v, (dict, list)))
+    return None
+
+
+def _decode_detail_after(text, key_at):
+    """Decode the value after the "aweme_detail" key at `key_at`; None unless it is an object."""
+    colon = text.find(":", key_at + len(_DETAIL_KEY))
+    if colon < 0:
+        return None
+    value_at = colon + 1
+    while value_at < len(text) and text[value_at] in " \t\r\n":
+        value_at += 1
+    if not text.startswith("{", value_at):
+        return None
+    value, _end = _json_decoder.raw_decode(text, value_at)
+    return value
+
+
+def _detail_from_blob(blob):
+    """
+    {"aweme_detail": {...}} from a RENDER_DATA blob (urlencoded or plain JSON).
+    Only the text from the first candidate key onwards is unquoted and decoded;
+    the whole tree is parsed only when that shortcut finds nothing.
+    """
+    quoted = blob.find(_QUOTED_DETAIL_KEY)
+    text = unquote(blob[quoted:]) if quoted >= 0 else blob
+    at = text.find(_DETAIL_KEY)
+    while at >= 0:
+        try:
+            value = _decode_detail_after(text, at)
+        except ValueError:
+            break
+        if isinstance(value, dict):
+            return {"aweme_detail": value}
+        at = text.find(_DETAIL_KEY, at + len(_DETAIL_KEY))
+    return iter_find_aweme_detail(json.loads(unquote(blob)))
+
+
+@register("sigi_state")
+def sigi_state_scan(html):
+    body = script_body(html, "SIGI_STATE")
+    if not body:
+        return None
+    src = src_from_sigi_state(json.loads(body))
+    return Extraction("sigi_state", src=src) if src else None
+
+
+@register("render_data")
+def render_data_scan(html):
+    blob = script_body(html, "RENDER_DATA")
+    if blob is None:
+        at = html.find("RENDER_DATA=")
+        m = _INLINE_RENDER_DATA.match(html, at) if at >= 0 else None
+        if not m:
+            return None
+        blob = m.group(1)
+    found = _detail_from_blob(blob)
+    return Extraction("render_data", detail=found) if found else None
+
+
+def find_render_data_detail(html, engine=DEFAULT_ENGINE):
+    """The {"aweme_detail": {...}} dict embedded in RENDER_DATA, if any."""
+    name = "render_data" if engine == "scan" else "render_data_regex"
+    try:
+        found = EXTRACTORS[name](html) if html else None
+    except Exception:
+        return None
+    return found.detail if found else None
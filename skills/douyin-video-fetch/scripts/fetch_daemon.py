@@ -0,0 +1,206 @@
+"""
+Long-running fetch daemon for douyin-video-fetch.
+
+Keeps Playwright, a persistent Chromium profile (so WAF cookies survive
+between jobs), the pooled MediaDownloader and the resolution cache warm, and
+accepts fetch jobs as JSON over localhost HTTP or a Unix socket:
+
+    POST /fetch   {"items": ["<url or video_id>", ...], "output_dir": "...", "metadata_only": false}
+    GET  /health
+    GET  /stats
+
+The browser profile is relaunched after --recycle-after items or once
+Chromium's RSS reaches --recycle-rss-mb, when every page still running on
+it has finished.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+from aiohttp import web
+from playwright.async_api import async_playwright
+
+from fetch_video import (
+    FAIL_EXCEPTION,
+    ContextSlot,
+    HostLimiter,
+    add_fetch_arguments,
+    browser_context_options,
+    cache_from_args,
+    chromium_launch_options,
+    fetch_item,
+    policy_from_args,
+    selection_from_args,
+)
+from media_download import MediaDownloader
+from process_memory import process_rss_mb
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = os.path.expanduser("~/.cache/douyin-video-fetch/profile")
+DEFAULT_RECYCLE_AFTER = 200
+
+
+class FetchDaemon:
+    def __init__(self, args):
+        self.args = args
+        self.output_dir = args.output_dir
+        self.queue = asyncio.Queue()
+        self.cache = cache_from_args(args)
+        self.policy = policy_from_args(args)
+        self.selection = selection_from_args(args)
+        self.limiter = HostLimiter(args.per_host_concurrency, args.per_host_rate)
+        self.started = time.monotonic()
+        self.busy = 0
+        self.done = 0
+        self.ok = 0
+        self.seconds_total = 0.0
+        self.bytes_deduplicated = 0
+        self.bytes_reused = 0
+        self.tiers = Counter()
+        self._playwright = None
+        self._workers = []
+        self.contexts = None
+        self.downloader = None
+
+    async def start(self, app):
+        self._playwright = await async_playwright().start()
+        self.contexts = ContextSlot(self._launch_profile, max_uses=self.args.recycle_after, max_rss_mb=self.args.recycle_rss_mb)
+        self.downloader = MediaDownloader(
+            connections=self.args.connections, dedup=not self.args.no_dedup,
+            store_dir=self.args.store_dir, reuse_existing=not self.args.overwrite,
+        )
+        await self.downloader.__aenter__()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(1, self.args.concurrency))]
+        logger.info(f"Fetch daemon ready with {len(self._workers)} workers")
+
+    async def stop(self, app):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self.contexts.close()
+        await self.downloader.close()
+        await self._playwright.stop()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def _launch_profile(self):
+        os.makedirs(self.args.profile_dir, exist_ok=True)
+        return await self._playwright.chromium.launch_persistent_context(
+            self.args.profile_dir, headless=True,
+            **chromium_launch_options(self.args.low_memory), **browser_context_options(self.args.low_memory),
+        )
+
+    async def _worker(self):
+        while True:
+            raw, output_dir, metadata_only, future = await self.queue.get()
+            self.busy += 1
+            started = time.monotonic()
+            try:
+                result = await fetch_item(
+                    raw, output_dir, self.downloader, self.contexts,
+                    fast_path=not self.args.no_fast_path, cache=self.cache, policy=self.policy, limiter=self.limiter,
+                    metadata_only=metadata_only, selection=self.selection,
+                )
+            except Exception as e:
+                logger.error(f"Job failed: {raw}: {e}")
+                result = {"input": raw, "ok": False, "output": "", "error": FAIL_EXCEPTION, "retryable": True, "detail": str(e)}
+            finally:
+                self.busy -= 1
+                self.queue.task_done()
+            self.done += 1
+            self.ok += 1 if result["ok"] else 0
+            self.seconds_total += time.monotonic() - started
+            self.bytes_deduplicated += result.get("bytes_deduplicated", 0)
+            self.bytes_reused += result.get("bytes_reused", 0)
+            self.tiers[result.get("tier") or "failed"] += 1
+            if not future.done():
+                future.set_result(result)
+
+    async def handle_fetch(self, request):
+        try:
+            body = await request.json()
+        except Exception:
+            return web.json_response({"error": "invalid JSON body"}, status=400)
+        items = body.get("items") or ([body["item"]] if body.get("item") else [])
+        if not isinstance(items, list) or not items:
+            return web.json_response({"error": "expected non-empty 'items'"}, status=400)
+        output_dir = body.get("output_dir") or self.output_dir
+        metadata_only = bool(body.get("metadata_only"))
+        os.makedirs(output_dir, exist_ok=True)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for raw in items:
+            future = loop.create_future()
+            self.queue.put_nowait((str(raw), output_dir, metadata_only, future))
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+        ok = sum(1 for r in results if r["ok"])
+        return web.json_response({"total": len(results), "ok": ok, "failed": len(results) - ok, "items": results})
+
+    async def handle_health(self, request):
+        return web.json_response({
+            "status": "ok",
+            "queued": self.queue.qsize(),
+            "busy": self.busy,
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+        })
+
+    async def handle_stats(self, request):
+        uptime = time.monotonic() - self.started
+        rss_mb, browser_rss_mb = process_rss_mb()
+        stats = {
+            "jobs": self.done,
+            "ok": self.ok,
+            "failed": self.done - self.ok,
+            "avg_seconds": round(self.seconds_total / self.done, 3) if self.done else 0.0,
+            "items_per_minute": round(self.done * 60.0 / uptime, 2) if uptime > 0 else 0.0,
+            "tiers": dict(self.tiers),
+            "bytes_deduplicated": self.bytes_deduplicated,
+            "bytes_reused": self.bytes_reused,
+            "context_recycles": self.contexts.recycles if self.contexts else 0,
+            "rss_mb": rss_mb,
+            "browser_rss_mb": browser_rss_mb,
+            "queued": self.queue.qsize(),
+            "busy": self.busy,
+        }
+        if self.cache is not None:
+            stats["cache"] = {"hits": self.cache.hits, "misses": self.cache.misses}
+        return web.json_response(stats)
+
+
+def build_app(args):
+    daemon = FetchDaemon(args)
+    app = web.Application()
+    app.on_startup.append(daemon.start)
+    app.on_cleanup.append(daemon.stop)
+    app.router.add_post("/fetch", daemon.handle_fetch)
+    app.router.add_get("/health", daemon.handle_health)
+    app.router.add_get("/stats", daemon.handle_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Douyin fetch jobs from a warm browser")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen address (ignored with --socket)")
+    parser.add_argument("--port", type=int, default=8787, help="Listen port (ignored with --socket)")
+    parser.add_argument("--socket", help="Serve on this Unix socket path instead of TCP")
+    parser.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR, help="Persistent Chromium profile directory")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs processed in parallel")
+    parser.add_argument("--recycle-after", type=int, default=DEFAULT_RECYCLE_AFTER, help="Relaunch the browser profile after this many items (0 = never)")
+    add_fetch_arguments(parser)
+    args = parser.parse_args()
+
+    app = build_app(args)
+    if args.socket:
+        web.run_app(app, path=args.socket)
+    else:
+        web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 
 import asyncio
 import os
+import sys
 import re
 import logging
+import math
 import time
 import random
 import json
 import argparse
-from urllib.parse import unquote
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
 from playwright.async_api import async_playwright
 import aiohttp
 
+from extractors import extract_html, find_render_data_detail, first_http_url
+from media_download import DEFAULT_CONNECTIONS, DownloadError, MediaDownloader
+from process_memory import children_rss_mb, process_rss_mb
+from resolve_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ResolveCache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -18,44 +27,321 @@ logger = logging.getLogger(__name__)
 CHALLENGE_CHECK_INTERVAL_MS = 2000
 CHALLENGE_MAX_WAIT_SECONDS = 45
 DETAIL_WAIT_MS = 8000
+HTTP_PAGE_TIMEOUT_SECONDS = 15
+RETRY_MAX_DELAY_SECONDS = 300
+MEDIA_GRACE_MS = 1500
+MAX_MEDIA_CANDIDATES = 8
+# An RSS-triggered recycle needs a few items on the context, so a baseline
+# above the threshold cannot make every item pay for a fresh context.
+RSS_RECYCLE_MIN_USES = 5
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+WAF_MARKERS = [
+    "please wait",
+    "waf-jschallenge",
+    "_wafchallengeid",
+    "argus-csp-token",
+]
+
+# Chromium flags for --low-memory: headless server use, no GPU/audio/background
+# services, images off (they are aborted anyway) and a capped V8 heap per renderer.
+LOW_MEMORY_CHROMIUM_ARGS = [
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    "--autoplay-policy=user-gesture-required",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-features=Translate,BackForwardCache,MediaRouter,OptimizationHints",
+    "--js-flags=--max-old-space-size=256",
+]
+LOW_MEMORY_VIEWPORT = {"width": 800, "height": 600}
+
+# Evaluated in the page so only a boolean crosses the CDP connection instead of the whole DOM.
+# Real video pages are recognised by their data blobs / <video> before any text scan happens.
+_CHALLENGE_CHECK_JS = """(markers) => {
+    if (document.getElementById('RENDER_DATA') || document.getElementById('SIGI_STATE') || document.querySelector('video')) {
+        return false;
+    }
+    const root = document.documentElement;
+    const text = root ? root.innerHTML.toLowerCase() : '';
+    return !text || markers.some(m => text.includes(m));
+}"""
+
+# Failure reasons recorded in result["error"].
+FAIL_NOT_FOUND = "not_found"
+FAIL_PAGE_LOAD = "page_load"
+FAIL_WAF_TIMEOUT = "waf_timeout"
+FAIL_NO_SRC = "no_src"
+FAIL_INVALID_SRC = "invalid_src"
+FAIL_DOWNLOAD_STATUS = "download_status"
+FAIL_DOWNLOAD_NETWORK = "download_network"
+FAIL_NO_METADATA = "no_metadata"
+FAIL_EXCEPTION = "exception"
+
+RETRYABLE_FAILURES = {FAIL_PAGE_LOAD, FAIL_WAF_TIMEOUT, FAIL_NO_SRC, FAIL_NO_METADATA, FAIL_DOWNLOAD_NETWORK, FAIL_EXCEPTION}
+
+def is_retryable(error, http_status=None):
+    if error == FAIL_DOWNLOAD_STATUS:
+        # Signed URLs expire (403) and CDNs throttle; a missing object (404/410) stays missing.
+        return http_status in (403, 408, 429) or (http_status or 0) >= 500
+    return error in RETRYABLE_FAILURES
+
+def _fail(info, reason, http_status=None):
+    if info is not None:
+        info["error"] = reason
+        info["http_status"] = http_status
+    return False
+
+def _note(info, **fields):
+    if info is not None:
+        info.update(fields)
+
+class _StageClock:
+    """Adds the time since the previous lap to info["timings"][stage]."""
+
+    def __init__(self, info):
+        self.info = info
+        self.mark = time.monotonic()
+
+    def lap(self, stage):
+        now = time.monotonic()
+        if self.info is not None:
+            timings = self.info.setdefault("timings", {})
+            timings[stage] = round(timings.get(stage, 0.0) + now - self.mark, 3)
+        self.mark = now
+
+def retry_delay(attempt, base_seconds):
+    """Exponential backoff with jitter so retries of a burst don't arrive together."""
+    delay = min(base_seconds * 2 ** (attempt - 1), RETRY_MAX_DELAY_SECONDS)
+    return delay * random.uniform(0.5, 1.5)
+
+class HostLimiter:
+    """Caps concurrent page requests and their start rate per host."""
+
+    def __init__(self, max_concurrent=0, rate_per_second=0.0):
+        self.max_concurrent = max_concurrent
+        self.min_interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._semaphores = {}
+        self._next_start = {}
+
+    async def acquire(self, host):
+        if self.max_concurrent:
+            sem = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+            await sem.acquire()
+        if self.min_interval:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, 0.0))
+            self._next_start[host] = start + self.min_interval
+            if start > now:
+                await asyncio.sleep(start - now)
+
+    def release(self, host):
+        if self.max_concurrent:
+            self._semaphores[host].release()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, host):
+        await self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+# Telemetry/monitoring endpoints the page reports to; none of them carry video data.
+ANALYTICS_HOSTS = [
+    "mcs.zijieapi.com",
+    "mon.zijieapi.com",
+    "mon.snssdk.com",
+    "log.snssdk.com",
+    "ibytedapm.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+]
+
+class RequestPolicy:
+    """
+    What the page may load while we extract the play URL. With `abort_media`
+    the page's own <video> stream is recorded as a media candidate and
+    aborted, so the mp4 only crosses the wire once (our own download).
+    """
+
+    def __init__(self, abort_media=True, block_hosts=()):
+        self.abort_media = abort_media
+        self.block_hosts = [h.lower() for h in block_hosts]
+
+    def blocks_host(self, url):
+        host = (urlparse(url).hostname or "").lower()
+        return any(host == h or host.endswith("." + h) for h in self.block_hosts)
+
+def _requested_range(range_header):
+    # "bytes=100-" -> (100, None); a missing header means the whole object.
+    m = re.match(r"bytes=(\d+)-(\d*)", range_header or "")
+    if not m:
+        return 0, None
+    return int(m.group(1)), int(m.group(2)) if m.group(2) else None
+
+def _bytes_saved(blocked_ranges, size):
+    saved = 0
+    for start, end in blocked_ranges:
+        end = size - 1 if end is None else min(end, size - 1)
+        saved += max(0, end - start + 1)
+    return saved
 
 def _looks_like_waf_challenge(html):
     if not html:
         return True
     text = html.lower()
-    markers = [
-        "please wait",
-        "waf-jschallenge",
-        "_wafchallengeid",
-        "argus-csp-token",
-    ]
-    return any(m in text for m in markers)
+    return any(m in text for m in WAF_MARKERS)
+
+class _CaptureSignals:
+    """
+    Futures resolved by the response listener, so waits end the moment the
+    aweme/detail payload or a media URL has been captured.
+    """
+
+    def __init__(self):
+        loop = asyncio.get_running_loop()
+        self.detail = loop.create_future()
+        self.media = loop.create_future()
+
+    def detail_captured(self, payload):
+        if not self.detail.done():
+            self.detail.set_result(payload)
 
-async def _wait_until_page_ready(page, max_wait_seconds=CHALLENGE_MAX_WAIT_SECONDS):
+    def media_captured(self, url):
+        if not self.media.done():
+            self.media.set_result(url)
+
+    def any_captured(self):
+        return self.detail.done() or self.media.done()
+
+    async def wait_any(self, timeout_ms):
+        if not self.any_captured():
+            await asyncio.wait([self.detail, self.media], timeout=timeout_ms / 1000, return_when=asyncio.FIRST_COMPLETED)
+        return self.any_captured()
+
+    async def wait_detail(self, timeout_ms):
+        if not self.detail.done():
+            await asyncio.wait([self.detail], timeout=timeout_ms / 1000)
+        return self.detail.done()
+
+async def _pause(page, signals, ms):
+    if signals is not None:
+        await signals.wait_any(ms)
+    else:
+        await page.wait_for_timeout(ms)
+
+async def _wait_until_page_ready(page, signals=None, max_wait_seconds=CHALLENGE_MAX_WAIT_SECONDS):
     deadline = time.monotonic() + max_wait_seconds
     while time.monotonic() < deadline:
+        # A captured detail/media response means the real page has loaded.
+        if signals is not None and signals.any_captured():
+            return True
         try:
-            html = await page.content()
+            challenged = await page.evaluate(_CHALLENGE_CHECK_JS, WAF_MARKERS)
         except Exception as e:
             msg = str(e).lower()
             if "navigating" in msg or "execution context was destroyed" in msg:
-                await page.wait_for_timeout(CHALLENGE_CHECK_INTERVAL_MS)
+                await _pause(page, signals, CHALLENGE_CHECK_INTERVAL_MS)
                 continue
             return False
-        if not _looks_like_waf_challenge(html):
+        if not challenged:
             return True
-        await page.wait_for_timeout(CHALLENGE_CHECK_INTERVAL_MS)
+        await _pause(page, signals, CHALLENGE_CHECK_INTERVAL_MS)
     return False
 
-def _first_http_url(urls):
-    if not isinstance(urls, list):
-        return None
-    for url in urls:
-        if isinstance(url, str) and url.startswith("http"):
-            return url
-    return None
+FALLBACK_ADDR_KEYS = ["play_addr_h264", "play_addr", "download_addr", "play_addr_265"]
+
+class VariantSelection:
+    """
+    Which bit_rate variant of a video to download. Without constraints the
+    highest bitrate wins. Otherwise variants above `max_bitrate` (bits/s) are
+    dropped (unless none is left, then the smallest is taken) and the rest are
+    ranked by closeness to `target_height` without exceeding it, then by
+    `prefer_codec` ("h264" / "h265"), then by bitrate. Heights compare the
+    short side, so 720 means 720p in portrait and landscape alike.
+    """
+
+    def __init__(self, max_bitrate=0, prefer_codec=None, target_height=0):
+        self.max_bitrate = max_bitrate
+        self.prefer_codec = prefer_codec
+        self.target_height = target_height
+
+    def rank(self, variants):
+        allowed = [v for v in variants if not self.max_bitrate or (v["bit_rate"] or 0) <= self.max_bitrate]
+        if not allowed:
+            return sorted(variants, key=lambda v: v["bit_rate"] or 0)
+        return sorted(allowed, key=self._key)
+
+    def _key(self, variant):
+        height = variant["height"]
+        if not self.target_height:
+            fit = (False, 0)
+        elif height:
+            fit = (height > self.target_height, abs(self.target_height - height))
+        else:
+            fit = (True, math.inf)
+        codec_miss = bool(self.prefer_codec) and variant["codec"] != self.prefer_codec
+        return (fit, codec_miss, -(variant["bit_rate"] or 0))
+
+    def fallback_keys(self):
+        if self.prefer_codec == "h265":
+            return ["play_addr_265"] + [k for k in FALLBACK_ADDR_KEYS if k != "play_addr_265"]
+        return FALLBACK_ADDR_KEYS
+
+def _variant_codec(item):
+    if item.get("is_h265") or item.get("is_bytevc1") or "bytevc1" in str(item.get("gear_name") or ""):
+        return "h265"
+    return "h264"
+
+def _variant_height(addr, gear_name=None):
+    # Short side of the frame; gear names look like "normal_720_0" / "adapt_lowest_1080_1".
+    sides = [addr.get("width"), addr.get("height")]
+    sides = [x for x in sides if isinstance(x, int) and x > 0]
+    if sides:
+        return min(sides)
+    m = re.search(r"_(\d{3,4})_", str(gear_name or ""))
+    return int(m.group(1)) if m else None
+
+def _variant(src, addr, bit_rate, codec, gear_name, duration_ms):
+    size = addr.get("data_size")
+    if not size and bit_rate and duration_ms:
+        size = int(bit_rate * duration_ms / 1000 / 8)
+    return {
+        "src": src,
+        "bit_rate": bit_rate,
+        "codec": codec,
+        "height": _variant_height(addr, gear_name),
+        "gear_name": gear_name,
+        "size_estimate": size or None,
+    }
+
+def _play_variants(aweme):
+    """Every downloadable bit_rate entry of an aweme_detail as a flat variant dict."""
+    video = aweme.get("video") if isinstance(aweme.get("video"), dict) else {}
+    duration_ms = video.get("duration") or aweme.get("duration") or 0
+    variants = []
+    for item in video.get("bit_rate") or []:
+        if not isinstance(item, dict):
+            continue
+        addr = item.get("play_addr") if isinstance(item.get("play_addr"), dict) else {}
+        src = first_http_url(addr.get("url_list"))
+        if src:
+            variants.append(_variant(src, addr, item.get("bit_rate", 0), _variant_codec(item), item.get("gear_name"), duration_ms))
+    return variants
 
-def _extract_src_from_aweme_detail(detail_payload):
+def _select_variant(detail_payload, selection=None):
+    """
+    The variant chosen from an aweme/detail payload, or None. bit_rate is None
+    when the src comes from the play_addr fallbacks.
+    """
     if not isinstance(detail_payload, dict):
         return None
     aweme = detail_payload.get("aweme_detail")
@@ -64,270 +350,510 @@ def _extract_src_from_aweme_detail(detail_payload):
     video = aweme.get("video")
     if not isinstance(video, dict):
         return None
+    selection = selection or VariantSelection()
 
-    # Prefer highest bitrate candidates first.
-    bit_rates = video.get("bit_rate")
-    if isinstance(bit_rates, list):
-        sortable = []
-        for item in bit_rates:
-            if not isinstance(item, dict):
-                continue
-            score = item.get("bit_rate", 0)
-            play_addr = item.get("play_addr")
-            urls = play_addr.get("url_list") if isinstance(play_addr, dict) else []
-            src = _first_http_url(urls)
-            if src:
-                sortable.append((score, src))
-        if sortable:
-            sortable.sort(key=lambda x: x[0], reverse=True)
-            return sortable[0][1]
+    ranked = selection.rank(_play_variants(aweme))
+    if ranked:
+        return ranked[0]
 
     # Fallbacks from detail payload.
-    for key in ["play_addr_h264", "play_addr", "download_addr", "play_addr_265"]:
+    for key in selection.fallback_keys():
         addr = video.get(key)
         if isinstance(addr, dict):
-            src = _first_http_url(addr.get("url_list"))
+            src = first_http_url(addr.get("url_list"))
             if src:
-                return src
+                codec = "h265" if key == "play_addr_265" else "h264"
+                return _variant(src, addr, None, codec, None, video.get("duration") or 0)
     return None
 
-def _deep_find_aweme_detail(obj):
+def _select_play_variant(detail_payload, selection=None):
+    """Returns (src, bit_rate) for the variant chosen from an aweme/detail payload."""
+    variant = _select_variant(detail_payload, selection)
+    if variant is None:
+        return None, None
+    return variant["src"], variant["bit_rate"]
+
+def _extract_src_from_aweme_detail(detail_payload, selection=None):
+    return _select_play_variant(detail_payload, selection)[0]
+
+def _note_aweme_detail(info, detail_payload, selection=None):
+    """Record the chosen variant and aweme_detail metadata for the result and the resolution cache."""
+    if info is None:
+        return
+    variant = _select_variant(detail_payload, selection)
+    info["bitrate"] = variant["bit_rate"] if variant else None
+    info["variant"] = {k: v for k, v in variant.items() if k != "src"} if variant else {}
+    info["aweme_detail"] = detail_payload.get("aweme_detail")
+
+def _extract_from_html_fallback(html: str, info=None, selection=None):
     """
-    Best-effort deep search for a dict that looks like {"aweme_detail": {...}}.
+    Fallbacks when network listeners don't catch aweme/detail: the page's
+    SIGI_STATE / RENDER_DATA blobs, through the extractors module.
     """
-    if isinstance(obj, dict):
-        if "aweme_detail" in obj and isinstance(obj.get("aweme_detail"), dict):
-            return obj
-        for v in obj.values():
-            found = _deep_find_aweme_detail(v)
-            if found:
-                return found
-    elif isinstance(obj, list):
-        for it in obj:
-            found = _deep_find_aweme_detail(it)
-            if found:
-                return found
+    found = extract_html(html)
+    if found is None:
+        return None
+    if found.src:
+        logger.info("Extracted src from SIGI_STATE")
+        _note(info, extractor=found.kind)
+        return found.src
+    src = _extract_src_from_aweme_detail(found.detail, selection)
+    if src:
+        logger.info("Extracted src from RENDER_DATA")
+        _note_aweme_detail(info, found.detail, selection)
+        _note(info, extractor=found.kind)
+        return src
     return None
 
-def _extract_src_from_sigi_state(state: dict):
+def normalize_aweme_metadata(aweme, play_url=None):
+    """Compact metadata record from an aweme_detail dict (durations in seconds)."""
+    video = aweme.get("video") if isinstance(aweme.get("video"), dict) else {}
+    author = aweme.get("author") if isinstance(aweme.get("author"), dict) else {}
+    cover = video.get("cover") if isinstance(video.get("cover"), dict) else {}
+    bitrates = []
+    for item in video.get("bit_rate") or []:
+        if not isinstance(item, dict):
+            continue
+        play_addr = item.get("play_addr") if isinstance(item.get("play_addr"), dict) else {}
+        bitrates.append({
+            "bit_rate": item.get("bit_rate"),
+            "codec": _variant_codec(item),
+            "gear_name": item.get("gear_name"),
+            "width": play_addr.get("width"),
+            "height": play_addr.get("height"),
+            "data_size": play_addr.get("data_size"),
+            "url": first_http_url(play_addr.get("url_list")),
+        })
+    duration_ms = video.get("duration") or aweme.get("duration") or 0
+    return {
+        "aweme_id": aweme.get("aweme_id", ""),
+        "desc": aweme.get("desc", ""),
+        "author": author.get("nickname", ""),
+        "author_uid": author.get("uid", ""),
+        "duration": round(duration_ms / 1000, 3),
+        "create_time": aweme.get("create_time"),
+        "cover_url": first_http_url(cover.get("url_list")) or "",
+        "play_url": play_url or "",
+        "bitrates": bitrates,
+    }
+
+def _finish_metadata(info, tier, selection=None):
+    """Complete a metadata-only item from info["aweme_detail"]; no media is downloaded."""
+    aweme = info.get("aweme_detail")
+    if not isinstance(aweme, dict):
+        return _fail(info, FAIL_NO_METADATA)
+    _note_aweme_detail(info, {"aweme_detail": aweme}, selection)
+    src = _extract_src_from_aweme_detail({"aweme_detail": aweme}, selection)
+    info.update(tier=tier, output="", metadata=normalize_aweme_metadata(aweme, src))
+    if src:
+        info["src"] = src
+    return True
+
+def chromium_launch_options(low_memory=False):
+    return {"args": LOW_MEMORY_CHROMIUM_ARGS} if low_memory else {}
+
+def browser_context_options(low_memory=False):
+    options = {"user_agent": USER_AGENT, "locale": "zh-CN"}
+    if low_memory:
+        options.update(viewport=LOW_MEMORY_VIEWPORT, service_workers="block")
+    return options
+
+async def _launch_browser(playwright, low_memory=False):
+    return await playwright.chromium.launch(headless=True, **chromium_launch_options(low_memory))
+
+async def _new_context(browser, low_memory=False):
+    return await browser.new_context(**browser_context_options(low_memory))
+
+class _LazyBrowser:
     """
-    Extract play URL from Douyin's SIGI_STATE blob (if present in HTML).
-    Structure varies; we try common shapes.
+    Starts Playwright and the shared Chromium on the first new_context() call,
+    so batches served entirely by the HTTP fast path never launch a browser.
     """
-    if not isinstance(state, dict):
-        return None
-    
-    # We don't have video_id constraint here easily, so we take the first valid video src we find
-    # or iterate through itemModule to find a likely candidate. 
-    # Since we are loading a specific video page, there should be one main video.
-    
-    item_module = state.get("ItemModule") or state.get("itemModule") or {}
-    if isinstance(item_module, dict):
-        for _k, v in item_module.items():
-            if not isinstance(v, dict):
-                continue
-            video = v.get("video") or {}
-            if not isinstance(video, dict):
-                continue
-            # Try common fields.
-            for key in ["playAddr", "play_addr", "downloadAddr", "download_addr"]:
-                addr = video.get(key)
-                if isinstance(addr, dict):
-                    src = _first_http_url(addr.get("urlList") or addr.get("url_list") or [])
-                    if src:
-                        return src
-    return None
 
-def _extract_from_html_fallback(html: str):
+    def __init__(self, low_memory=False):
+        self.low_memory = low_memory
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+
+    async def new_context(self):
+        async with self._lock:
+            if self._browser is None:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await _launch_browser(self._playwright, self.low_memory)
+        return await _new_context(self._browser, self.low_memory)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+class ContextSlot:
     """
-    Fallbacks when network listeners don't catch aweme/detail:
-    1) <script id="SIGI_STATE" type="application/json">...</script>
-    2) RENDER_DATA=... (urlencoded json) presence in HTML.
+    A browser context created on first use and shared by whoever acquires it.
+    It is replaced after `max_uses` items, or once the browser processes'
+    RSS reaches `max_rss_mb`, but only when every page still using the old
+    one has been released.
     """
-    if not html:
+
+    def __init__(self, factory, max_uses=0, max_rss_mb=0):
+        self._factory = factory
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self._context = None
+        self._uses = 0
+        self._active = 0
+        self._recycling = False
+        self._cond = asyncio.Condition()
+        self.recycles = 0
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._recycling)
+            reason = self._recycle_reason()
+            if reason:
+                self._recycling = True
+                try:
+                    await self._cond.wait_for(lambda: self._active == 0)
+                    logger.info(f"Recycling browser context after {self._uses} items ({reason})")
+                    await self._context.close()
+                finally:
+                    self._context = None
+                    self._recycling = False
+                    self.recycles += 1
+                    self._cond.notify_all()
+            if self._context is None:
+                self._context = await self._factory()
+                self._uses = 0
+            self._uses += 1
+            self._active += 1
+            return self._context
+
+    def _recycle_reason(self):
+        if self._context is None:
+            return None
+        if self.max_uses and self._uses >= self.max_uses:
+            return "max uses"
+        if self.max_rss_mb and self._uses >= RSS_RECYCLE_MIN_USES:
+            rss = children_rss_mb()
+            if rss >= self.max_rss_mb:
+                return f"browser RSS {rss:.0f} MB"
         return None
 
-    # SIGI_STATE JSON
-    m = re.search(r'<script[^>]+id="SIGI_STATE"[^>]*>(.*?)</script>', html, re.S)
-    if m:
-        try:
-            state = json.loads(m.group(1))
-            src = _extract_src_from_sigi_state(state)
-            if src:
-                logger.info("Extracted src from SIGI_STATE")
-                return src
-        except Exception:
-            pass
+    async def release(self):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
 
-    # RENDER_DATA urlencoded JSON sometimes appears as query-like "RENDER_DATA=..."
-    m = re.search(r"RENDER_DATA=([^&]+)&", html)
-    if m:
-        try:
-            decoded = unquote(m.group(1))
-            data = json.loads(decoded)
-            found = _deep_find_aweme_detail(data)
-            src = _extract_src_from_aweme_detail(found) if found else None
-            if src:
-                logger.info("Extracted src from RENDER_DATA")
-                return src
-        except Exception:
-            pass
+    async def close(self):
+        if self._context is not None:
+            await self._context.close()
+            self._context = None
 
-    return None
+async def _download_src(src, output_path, headers, downloader=None, info=None):
+    logger.info(f"Downloading stream from {src}")
+    clock = _StageClock(info)
+    try:
+        if downloader is None:
+            async with MediaDownloader() as own_downloader:
+                stats = await own_downloader.download(src, output_path, headers)
+        else:
+            stats = await downloader.download(src, output_path, headers)
+    except DownloadError as e:
+        clock.lap("download")
+        logger.warning(f"Failed download: {e}")
+        reason = FAIL_DOWNLOAD_STATUS if e.status is not None else FAIL_DOWNLOAD_NETWORK
+        return _fail(info, reason, e.status)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        # Anything the downloader did not map to DownloadError (bad URL, disk
+        # errors, ...) fails this item so the caller can escalate, not the batch.
+        clock.lap("download")
+        logger.warning(f"Failed download: {e}")
+        return _fail(info, FAIL_DOWNLOAD_NETWORK)
+    clock.lap("download")
+    _note(info, bytes=stats["fetched_bytes"], mb_per_s=stats["mb_per_s"], sha256=stats["sha256"],
+          bytes_deduplicated=stats["deduplicated_bytes"], bytes_reused=stats["reused_bytes"])
+    logger.info(f"Successfully downloaded to {output_path}")
+    return True
 
-async def download_video(video_url, output_path):
+async def fetch_via_http(video_url, output_path, downloader, info=None, limiter=None, metadata_only=False, selection=None):
+    """
+    Fast path: plain GET of the video page through the pooled session, run
+    through the HTML extractors. Returns False (caller escalates to the
+    browser) on errors, WAF challenge pages or when nothing is extracted.
+    With `metadata_only` it stops at the embedded aweme_detail.
+    """
+    limiter = limiter or HostLimiter()
+    info = {} if info is None else info
+    headers = {
+        "User-Agent": USER_AGENT,
+        "Referer": "https://www.douyin.com/",
+        "Accept-Language": "zh-CN,zh;q=0.9",
+    }
+    clock = _StageClock(info)
+    try:
+        timeout = aiohttp.ClientTimeout(total=HTTP_PAGE_TIMEOUT_SECONDS)
+        async with limiter.hold(urlparse(video_url).hostname):
+            async with downloader.session.get(video_url, headers=headers, timeout=timeout) as resp:
+                if resp.status != 200:
+                    logger.info(f"Fast path got status {resp.status}, escalating to browser")
+                    return False
+                html = await resp.text(errors="replace")
+    except Exception as e:
+        logger.info(f"Fast path fetch failed, escalating to browser: {e}")
+        return False
+    finally:
+        clock.lap("http_page")
+
+    if _looks_like_waf_challenge(html):
+        logger.info("Fast path hit WAF challenge, escalating to browser")
+        return False
+    if metadata_only:
+        found = find_render_data_detail(html)
+        clock.lap("extract")
+        if not found:
+            logger.info("Fast path found no aweme_detail, escalating to browser")
+            return False
+        _note_aweme_detail(info, found, selection)
+        _note(info, extractor="render_data")
+        return _finish_metadata(info, "http", selection)
+    src = _extract_from_html_fallback(html, info, selection)
+    clock.lap("extract")
+    if not src or not src.startswith("http"):
+        logger.info("Fast path found no src, escalating to browser")
+        return False
+    if info is not None:
+        info["src"] = src
+
+    if not await _download_src(src, output_path, headers, downloader, info):
+        return False
+    if info is not None:
+        info["tier"] = "http"
+    return True
+
+async def download_video(video_url, output_path, context=None, downloader=None, info=None, policy=None, limiter=None, metadata_only=False,
+                         selection=None):
     """
     Open page, get video src, download file.
+    When `context` is given the page is opened in it (shared browser); otherwise
+    a throwaway browser is launched for this single video. `downloader` is the
+    batch-wide MediaDownloader; without one a private session is used.
+    `info`, if given, is filled with details about how the item was served.
+    `policy` is the RequestPolicy for the page (default: abort media streams).
+    `limiter` is a HostLimiter held from navigation until the src is known.
+    `selection` is the VariantSelection applied to aweme/detail bit_rates.
+    With `metadata_only` the page is closed as soon as aweme/detail has been
+    captured and info["metadata"] is filled instead of downloading.
+    On failure info["error"] carries one of the FAIL_* reasons.
     """
-    async with async_playwright() as p:
-        # Launch browser
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            locale="zh-CN"
-        )
-        
-        page = await context.new_page()
-        try:
-            logger.info(f"Processing URL: {video_url}")
-            aweme_detail_payload = None
-            media_candidates = []
-            response_tasks = []
-            
-            # Block non-essential assets to reduce load while keeping scripts/media.
-            async def route_handler(route):
-                if route.request.resource_type in ["image", "font", "stylesheet"]:
-                    await route.abort()
-                else:
-                    await route.continue_()
+    if context is None:
+        async with async_playwright() as p:
+            browser = await _launch_browser(p)
+            try:
+                context = await _new_context(browser)
+                return await download_video(video_url, output_path, context=context, downloader=downloader, info=info, policy=policy, limiter=limiter, metadata_only=metadata_only,
+                                            selection=selection)
+            finally:
+                await browser.close()
 
-            await page.route("**/*", route_handler)
+    policy = policy or RequestPolicy()
+    limiter = limiter or HostLimiter()
+    info = {} if info is None else info
+    host = urlparse(video_url).hostname
+    host_held = False
 
-            async def handle_response(response):
-                nonlocal aweme_detail_payload
-                try:
-                    url = response.url
-                    if (
-                        response.status in [200, 206]
-                        and "douyinvod.com" in url
-                        and url.startswith("http")
-                    ):
-                        media_candidates.append(url)
-
-                    if (
-                        response.status == 200
-                        and "/aweme/v1/web/aweme/detail/" in url
-                        and aweme_detail_payload is None
-                    ):
-                        aweme_detail_payload = await response.json()
-                except Exception:
-                    return
+    page = await context.new_page()
+    try:
+        logger.info(f"Processing URL: {video_url}")
+        aweme_detail_payload = None
+        media_candidates = []
+        response_tasks = []
+        signals = _CaptureSignals()
+        blocked_ranges = []
+        blocked_requests = 0
+        responses_seen = 0
+        clock = _StageClock(info)
 
-            def on_response(response):
-                task = asyncio.create_task(handle_response(response))
-                response_tasks.append(task)
+        def capture_media(url):
+            if url not in media_candidates and len(media_candidates) < MAX_MEDIA_CANDIDATES:
+                media_candidates.append(url)
+            signals.media_captured(url)
 
-            page.on("response", on_response)
+        # Block non-essential assets to reduce load while keeping scripts.
+        # Media is captured at request time so aborting it doesn't lose the candidate.
+        async def route_handler(route):
+            nonlocal blocked_requests
+            request = route.request
+            url = request.url
+            if policy.abort_media and (request.resource_type == "media" or "douyinvod.com" in url):
+                if "douyinvod.com" in url and url.startswith("http"):
+                    capture_media(url)
+                blocked_ranges.append(_requested_range(request.headers.get("range")))
+                await route.abort()
+            elif request.resource_type in ["image", "font", "stylesheet"] or policy.blocks_host(url):
+                blocked_requests += 1
+                await route.abort()
+            else:
+                await route.continue_()
 
-            try:
-                await page.goto(video_url, wait_until="domcontentloaded", timeout=60000)
-            except Exception as e:
-                logger.warning(f"Timeout/Error loading page: {e}")
-                return False
+        await page.route("**/*", route_handler)
 
-            # Fast fail for "video not found" redirects (avoid burning retries / time).
+        async def handle_detail(response):
+            nonlocal aweme_detail_payload
             try:
-                u = (page.url or "").lower()
-                if "web_video_404_link" in u or "item_non_existent" in u:
-                    logger.warning(f"Video appears non-existent (url={page.url})")
-                    return False
+                payload = await response.json()
             except Exception:
-                pass
+                return
+            if aweme_detail_payload is None:
+                aweme_detail_payload = payload
+                signals.detail_captured(payload)
 
-            # Douyin may first return a WAF challenge page; wait until the real page is ready.
-            ready = await _wait_until_page_ready(page, max_wait_seconds=CHALLENGE_MAX_WAIT_SECONDS)
-            if not ready:
-                logger.warning(f"WAF challenge not resolved in time")
-                return False
+        def on_response(response):
+            # Filter synchronously: only an aweme/detail body needs a task to read it,
+            # every other response is dropped without allocating anything.
+            nonlocal responses_seen
+            responses_seen += 1
+            url = response.url
+            if "douyinvod.com" in url:
+                if response.status in [200, 206] and url.startswith("http"):
+                    capture_media(url)
+            elif (
+                response.status == 200
+                and "/aweme/v1/web/aweme/detail/" in url
+                and aweme_detail_payload is None
+            ):
+                response_tasks.append(asyncio.create_task(handle_detail(response)))
 
-            # Give async response listeners a short window to capture aweme/detail and media URLs.
-            await page.wait_for_timeout(DETAIL_WAIT_MS)
-            if response_tasks:
-                await asyncio.gather(*response_tasks, return_exceptions=True)
+        page.on("response", on_response)
 
-            src = None
+        await limiter.acquire(host)
+        host_held = True
+        clock.lap("host_wait")
+        try:
+            await page.goto(video_url, wait_until="domcontentloaded", timeout=60000)
+        except Exception as e:
+            logger.warning(f"Timeout/Error loading page: {e}")
+            return _fail(info, FAIL_PAGE_LOAD)
+        finally:
+            clock.lap("goto")
+
+        # Fast fail for "video not found" redirects (avoid burning retries / time).
+        try:
+            u = (page.url or "").lower()
+            if "web_video_404_link" in u or "item_non_existent" in u:
+                logger.warning(f"Video appears non-existent (url={page.url})")
+                return _fail(info, FAIL_NOT_FOUND)
+        except Exception:
+            pass
+
+        # Douyin may first return a WAF challenge page; wait until the real page is ready.
+        ready = await _wait_until_page_ready(page, signals, max_wait_seconds=CHALLENGE_MAX_WAIT_SECONDS)
+        clock.lap("ready")
+        if not ready:
+            logger.warning(f"WAF challenge not resolved in time")
+            return _fail(info, FAIL_WAF_TIMEOUT)
+
+        if metadata_only:
+            # Only aweme/detail matters; stop the moment it is captured.
+            await signals.wait_detail(DETAIL_WAIT_MS)
+            clock.lap("detail_wait")
+            _note(info, responses_seen=responses_seen)
             if aweme_detail_payload:
-                logger.info("Found aweme_detail payload via network interception")
-                src = _extract_src_from_aweme_detail(aweme_detail_payload)
-            
-            if not src and media_candidates:
-                logger.info("Using intercepted media candidate")
-                src = media_candidates[0]
-            
-            if not src:
-                try:
-                    html = await page.content()
-                    src = _extract_from_html_fallback(html)
-                except Exception:
-                    src = None
-            
-            if not src:
-                # Fallback: parse from DOM video tag if present.
-                try:
-                    logger.info("Attempting DOM extraction")
-                    src = await page.evaluate("""() => {
-                        const v = document.querySelector('video');
-                        if (!v) return null;
-                        if (v.src && v.src.startsWith('http')) return v.src;
-                        const sources = Array.from(v.querySelectorAll('source'));
-                        const mp4 = sources.find(s => s.type === 'video/mp4');
-                        return mp4 ? mp4.src : (sources[0] ? sources[0].src : null);
-                    }""")
-                except Exception as e:
-                    logger.warning(f"DOM src evaluate failed: {e}")
-                    src = None
-
-            if not src:
-                logger.warning(f"No src extraction successful")
-                return False
-                
-            # Only use if http/https
-            if not src.startswith("http"):
-                logger.warning(f"Invalid src: {src}")
-                return False
-
-            # Download
-            logger.info(f"Downloading stream from {src}")
-            
-            # Use headers that mimic browser
-            headers = {
-                "User-Agent": await page.evaluate("navigator.userAgent"),
-                "Referer": "https://www.douyin.com/"
-            }
+                _note_aweme_detail(info, aweme_detail_payload, selection)
+                _note(info, extractor="network_detail")
+            else:
+                found = find_render_data_detail(await page.content())
+                if found:
+                    _note_aweme_detail(info, found, selection)
+                    _note(info, extractor="render_data")
+            clock.lap("extract")
+            return _finish_metadata(info, "browser", selection)
+
+        # Wait for aweme/detail or a media URL; DETAIL_WAIT_MS is only the fallback when neither arrives.
+        if await signals.wait_any(DETAIL_WAIT_MS) and not signals.detail.done():
+            # A media URL came first; give aweme/detail a short grace period since it carries every bitrate.
+            await signals.wait_detail(MEDIA_GRACE_MS)
+        if response_tasks:
+            await asyncio.gather(*response_tasks, return_exceptions=True)
+        clock.lap("detail_wait")
+        _note(info, responses_seen=responses_seen)
+
+        src = None
+        if aweme_detail_payload:
+            logger.info("Found aweme_detail payload via network interception")
+            src = _extract_src_from_aweme_detail(aweme_detail_payload, selection)
+            if src:
+                _note_aweme_detail(info, aweme_detail_payload, selection)
+                _note(info, extractor="network_detail")
+        
+        if not src and media_candidates:
+            logger.info("Using intercepted media candidate")
+            src = media_candidates[0]
+            _note(info, extractor="media_candidate")
+        
+        if not src:
+            try:
+                html = await page.content()
+                src = _extract_from_html_fallback(html, info, selection)
+            except Exception:
+                src = None
+        
+        if not src:
+            # Fallback: parse from DOM video tag if present.
+            try:
+                logger.info("Attempting DOM extraction")
+                src = await page.evaluate("""() => {
+                    const v = document.querySelector('video');
+                    if (!v) return null;
+                    if (v.src && v.src.startsWith('http')) return v.src;
+                    const sources = Array.from(v.querySelectorAll('source'));
+                    const mp4 = sources.find(s => s.type === 'video/mp4');
+                    return mp4 ? mp4.src : (sources[0] ? sources[0].src : null);
+                }""")
+                if src:
+                    _note(info, extractor="dom")
+            except Exception as e:
+                logger.warning(f"DOM src evaluate failed: {e}")
+                src = None
+
+        clock.lap("extract")
+        if not src:
+            logger.warning(f"No src extraction successful")
+            return _fail(info, FAIL_NO_SRC)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(src, headers=headers, timeout=120) as resp:
-                    if resp.status in [200, 206]:
-                        with open(output_path, 'wb') as f:
-                            while True:
-                                chunk = await resp.content.read(1024*1024)
-                                if not chunk:
-                                    break
-                                f.write(chunk)
-                        
-                        logger.info(f"Successfully downloaded to {output_path}")
-                        return True
-                    else:
-                        logger.warning(f"Failed download: Status {resp.status}")
-                        return False
+        # Only use if http/https
+        if not src.startswith("http"):
+            logger.warning(f"Invalid src: {src}")
+            return _fail(info, FAIL_INVALID_SRC)
 
-        except Exception as e:
-            logger.error(f"Error processing: {e}")
-            return False
-        finally:
-            await page.close()
+        if info is not None:
+            info["src"] = src
+        limiter.release(host)
+        host_held = False
+
+        # Use headers that mimic browser
+        headers = {
+            "User-Agent": await page.evaluate("navigator.userAgent"),
+            "Referer": "https://www.douyin.com/"
+        }
         
-        await browser.close()
+        if not await _download_src(src, output_path, headers, downloader, info):
+            return False
+        if info is not None:
+            info["tier"] = "browser"
+            info["bytes_saved"] = _bytes_saved(blocked_ranges, os.path.getsize(output_path))
+            info["requests_blocked"] = blocked_requests + len(blocked_ranges)
+        return True
+
+    except Exception as e:
+        logger.error(f"Error processing: {e}")
+        return _fail(info, FAIL_EXCEPTION)
+    finally:
+        if host_held:
+            limiter.release(host)
+        await page.close()
 
 
 
@@ -342,6 +868,53 @@ def normalize_input_to_url(item: str) -> str:
     return item
 
 
+class ResultSink:
+    """
+    Emits every result as one NDJSON line the moment it completes: to stdout
+    with `ndjson`, and appended to `results_file` so a restarted run can skip
+    what is already done. Each record is a single write, so lines from several
+    worker processes do not interleave.
+    """
+
+    def __init__(self, ndjson=False, results_file=None):
+        self.ndjson = ndjson
+        self.results_file = results_file
+        self._fd = None
+
+    def __getstate__(self):
+        # Worker processes reopen the results file themselves.
+        state = dict(self.__dict__)
+        state["_fd"] = None
+        return state
+
+    def emit(self, result):
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        if self.ndjson:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        if self.results_file:
+            if self._fd is None:
+                self._fd = os.open(self.results_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, line.encode("utf-8"))
+
+
+def load_completed(results_file):
+    """Results already marked ok in an append-only results file, keyed by input."""
+    done = {}
+    if not results_file or not os.path.exists(results_file):
+        return done
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a truncated last line.
+                continue
+            if isinstance(record, dict) and record.get("ok") and record.get("input"):
+                done[record["input"]] = record
+    return done
+
+
 def read_inputs(args):
     items = []
     if args.file:
@@ -361,16 +934,385 @@ def read_inputs(args):
     return out
 
 
-async def run_batch(items, output_dir):
+def _video_id_from_url(url):
+    vid_match = re.search(r"/video/(\d{8,25})", url)
+    return vid_match.group(1) if vid_match else None
+
+
+def _prepare_job(raw, output_dir):
+    url = normalize_input_to_url(raw)
+    vid = _video_id_from_url(url) or str(int(time.time()*1000))
+    output_path = os.path.join(output_dir, f"{vid}.mp4")
+    return url, vid, output_path
+
+
+def _items_per_minute(count, elapsed):
+    return count * 60.0 / elapsed if elapsed > 0 else 0.0
+
+
+async def fetch_from_cache(cache, video_id, output_path, downloader, info=None, metadata_only=False, selection=None):
+    """
+    Download a warm video_id straight from its cached play URL. A failed
+    download (expired signature, 403, unreachable host, ...) drops the entry
+    so the caller re-resolves it. With `metadata_only` the cached aweme_detail is enough.
+    When the entry carries aweme_detail the variant is re-chosen with
+    `selection`, so a changed policy does not reuse the old pick.
+    """
+    entry = cache.get(video_id)
+    if entry is None:
+        return False
+    info = {} if info is None else info
+    if metadata_only:
+        if not entry.get("aweme_detail"):
+            return False
+        info["aweme_detail"] = entry["aweme_detail"]
+        _note(info, extractor="cache")
+        return _finish_metadata(info, "cache", selection)
+    # The cached detail/variant/error go into `scratch` and reach `info` only on
+    # success, so a re-resolution never reports (or caches) the stale entry's fields.
+    scratch = {"timings": info.setdefault("timings", {})}
+    src = entry["src"]
+    if entry.get("aweme_detail"):
+        payload = {"aweme_detail": entry["aweme_detail"]}
+        src = _extract_src_from_aweme_detail(payload, selection) or src
+        _note_aweme_detail(scratch, payload, selection)
+    logger.info(f"Using cached play URL for {video_id}")
+    headers = {"User-Agent": USER_AGENT, "Referer": "https://www.douyin.com/"}
+    try:
+        ok = await _download_src(src, output_path, headers, downloader, scratch)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        logger.warning(f"Cached play URL for {video_id} failed: {e}")
+        ok = _fail(scratch, FAIL_DOWNLOAD_NETWORK)
+    if not ok:
+        logger.info(f"Cached play URL for {video_id} is stale, re-resolving")
+        cache.invalidate(video_id)
+        return False
+    info.update(scratch)
+    _note(info, tier="cache", extractor="cache")
+    return True
+
+
+def _result_record(raw, url, vid, output_path, ok, info):
+    error = "" if ok else info.get("error") or FAIL_EXCEPTION
+    record = {
+        "input": raw,
+        "url": url,
+        "video_id": vid,
+        "ok": bool(ok),
+        "output": info.get("output", output_path) if ok else "",
+        "tier": info.get("tier", ""),
+        "bytes_saved": info.get("bytes_saved", 0),
+        "extractor": info.get("extractor", ""),
+        "timings": info.get("timings", {}),
+        "bytes": info.get("bytes", 0) if ok else 0,
+        "mb_per_s": info.get("mb_per_s", 0.0) if ok else 0.0,
+        "sha256": info.get("sha256", "") if ok else "",
+        "bytes_deduplicated": info.get("bytes_deduplicated", 0) if ok else 0,
+        "bytes_reused": info.get("bytes_reused", 0) if ok else 0,
+        "responses_seen": info.get("responses_seen", 0),
+        "variant": info.get("variant", {}),
+        "rss_mb": info.get("rss_mb", 0.0),
+        "browser_rss_mb": info.get("browser_rss_mb", 0.0),
+        "error": error,
+        "retryable": bool(error) and is_retryable(error, info.get("http_status")),
+        "attempts": 1,
+    }
+    if info.get("metadata"):
+        record["metadata"] = info["metadata"]
+    return record
+
+
+async def _fetch_in_browser(url, output_path, downloader, contexts, info, **options):
+    clock = _StageClock(info)
+    try:
+        context = await contexts.acquire()
+    except Exception as e:
+        # e.g. Chromium missing or failing to launch; fail the item, not the whole batch.
+        clock.lap("browser_acquire")
+        logger.error(f"Browser unavailable for {url}: {e}")
+        return _fail(info, FAIL_EXCEPTION)
+    clock.lap("browser_acquire")
+    try:
+        return await download_video(url, output_path, context=context, downloader=downloader, info=info, **options)
+    finally:
+        await contexts.release()
+
+
+async def fetch_item(raw, output_dir, downloader, contexts, fast_path=True, cache=None, policy=None, limiter=None, metadata_only=False,
+                     selection=None):
+    """
+    Resolve and download one input through the tiers (cache, HTTP fast path,
+    browser) and return its result dict. `contexts` is the ContextSlot the
+    browser tier takes its context from. With `metadata_only` nothing is
+    downloaded and the result carries a normalized `metadata` record.
+    `selection` (VariantSelection) picks the bit_rate variant to fetch.
+    """
+    url, vid, output_path = _prepare_job(raw, output_dir)
+    cache_key = _video_id_from_url(url) if cache is not None else None
+    info = {}
+    started = time.monotonic()
+    ok = bool(cache_key) and await fetch_from_cache(cache, cache_key, output_path, downloader, info, metadata_only=metadata_only, selection=selection)
+    if not ok and fast_path:
+        ok = await fetch_via_http(url, output_path, downloader, info, limiter=limiter, metadata_only=metadata_only, selection=selection)
+    if not ok:
+        ok = await _fetch_in_browser(url, output_path, downloader, contexts, info, policy=policy, limiter=limiter,
+                                     metadata_only=metadata_only, selection=selection)
+    if ok and cache_key and info.get("tier") != "cache" and info.get("src"):
+        cache.put(cache_key, info["src"], info.get("bitrate"), info.get("aweme_detail"))
+    info.setdefault("timings", {})["total"] = round(time.monotonic() - started, 3)
+    info["rss_mb"], info["browser_rss_mb"] = process_rss_mb()
+    return _result_record(raw, url, vid, output_path, ok, info)
+
+
+async def run_batch(items, output_dir, concurrency=1, connections=DEFAULT_CONNECTIONS, fast_path=True, cache=None, policy=None, sink=None,
+                    retries=0, retry_base_seconds=5.0, per_host_concurrency=0, per_host_rate=0.0, metadata_only=False,
+                    recycle_after=0, recycle_rss_mb=0, low_memory=False, selection=None,
+                    dedup=False, store_dir=None, reuse_existing=False):
+    """
+    Download all items with one shared browser. `concurrency` workers pull from
+    an asyncio queue, each keeping its own context (and WAF cookies) alive.
+    Media goes through one pooled MediaDownloader using up to `connections`
+    ranged requests per file. With `fast_path` each item is first tried with a
+    plain HTTP page fetch and only escalates to the browser when that fails.
+    Results are returned in input order; `tier` records which one succeeded.
+    `cache` is an optional ResolveCache: warm video_ids skip resolution
+    entirely and fresh resolutions are stored back into it. `policy` is the
+    RequestPolicy applied to browser pages. `sink`, if given, receives each
+    result as soon as its item completes.
+    Failures whose reason is retryable are requeued up to `retries` times with
+    exponential backoff and jitter; page requests are limited per host by
+    `per_host_concurrency` and `per_host_rate` (requests/second, 0 = no limit).
+    With `metadata_only` items stop at aweme/detail and nothing is downloaded.
+    Each worker's context is recycled after `recycle_after` items or when the
+    browser processes reach `recycle_rss_mb`; `low_memory` launches Chromium
+    with LOW_MEMORY_CHROMIUM_ARGS. `selection` is the VariantSelection.
+    `dedup`, `store_dir` and `reuse_existing` configure the MediaDownloader's
+    content store and its skip of files already on disk.
+    """
     os.makedirs(output_dir, exist_ok=True)
-    results = []
-    for raw in items:
-        url = normalize_input_to_url(raw)
-        vid_match = re.search(r"/video/(\d{8,25})", url)
-        vid = vid_match.group(1) if vid_match else str(int(time.time()*1000))
-        output_path = os.path.join(output_dir, f"{vid}.mp4")
-        ok = await download_video(url, output_path)
-        results.append({"input": raw, "url": url, "video_id": vid, "ok": bool(ok), "output": output_path if ok else ""})
+    if not items:
+        return []
+    results = [None] * len(items)
+    queue = asyncio.Queue()
+    for index, raw in enumerate(items):
+        queue.put_nowait((index, raw, 1))
+    workers = max(1, min(concurrency, len(items)))
+    remaining = len(items)
+    limiter = HostLimiter(per_host_concurrency, per_host_rate)
+    loop = asyncio.get_running_loop()
+
+    def finish(index, result):
+        nonlocal remaining
+        results[index] = result
+        if sink is not None:
+            sink.emit(result)
+        remaining -= 1
+        if remaining == 0:
+            for _ in range(workers):
+                queue.put_nowait(None)
+
+    async def worker(browser, downloader):
+        contexts = ContextSlot(browser.new_context, max_uses=recycle_after, max_rss_mb=recycle_rss_mb)
+        try:
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                index, raw, attempt = job
+                result = await fetch_item(raw, output_dir, downloader, contexts, fast_path=fast_path, cache=cache, policy=policy, limiter=limiter,
+                                          metadata_only=metadata_only, selection=selection)
+                result["attempts"] = attempt
+                if not result["ok"] and result["retryable"] and attempt <= retries:
+                    delay = retry_delay(attempt, retry_base_seconds)
+                    logger.info(f"Retrying {raw} in {delay:.1f}s after {result['error']} (attempt {attempt})")
+                    loop.call_later(delay, queue.put_nowait, (index, raw, attempt + 1))
+                    continue
+                finish(index, result)
+        finally:
+            await contexts.close()
+
+    started = time.monotonic()
+    browser = _LazyBrowser(low_memory=low_memory)
+    downloader = MediaDownloader(connections=connections, dedup=dedup, store_dir=store_dir, reuse_existing=reuse_existing)
+    async with downloader:
+        try:
+            await asyncio.gather(*(worker(browser, downloader) for _ in range(workers)))
+        finally:
+            await browser.close()
+    elapsed = time.monotonic() - started
+    logger.info(f"Batch finished: {len(items)} items in {elapsed:.1f}s ({_items_per_minute(len(items), elapsed):.1f} items/min)")
+    return results
+
+
+def _percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list.
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def stage_summary(results):
+    """p50/p95/p99 seconds per stage over all results, plus download totals."""
+    per_stage = {}
+    for r in results:
+        for stage, seconds in (r.get("timings") or {}).items():
+            per_stage.setdefault(stage, []).append(seconds)
+    stages = {}
+    for stage, values in sorted(per_stage.items()):
+        values.sort()
+        stages[stage] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+        }
+    downloaded = sum(r.get("bytes", 0) for r in results)
+    deduplicated = sum(r.get("bytes_deduplicated", 0) for r in results)
+    reused = sum(r.get("bytes_reused", 0) for r in results)
+    peak_rss = max((r.get("rss_mb", 0.0) for r in results), default=0.0)
+    peak_browser_rss = max((r.get("browser_rss_mb", 0.0) for r in results), default=0.0)
+    download_seconds = sum((r.get("timings") or {}).get("download", 0.0) for r in results if r.get("ok"))
+    return {
+        "stages": stages,
+        "bytes": downloaded,
+        "download_mb_per_s": round(downloaded / (1024 * 1024) / download_seconds, 3) if download_seconds > 0 else 0.0,
+        "bytes_deduplicated": deduplicated,
+        "bytes_reused": reused,
+        "peak_rss_mb": peak_rss,
+        "peak_browser_rss_mb": peak_browser_rss,
+    }
+
+
+def format_prometheus(summary, results):
+    ok = sum(1 for r in results if r.get("ok"))
+    lines = [
+        "# TYPE douyin_fetch_items_total counter",
+        f'douyin_fetch_items_total{{status="ok"}} {ok}',
+        f'douyin_fetch_items_total{{status="failed"}} {len(results) - ok}',
+        "# TYPE douyin_fetch_bytes_total counter",
+        f"douyin_fetch_bytes_total {summary['bytes']}",
+        "# TYPE douyin_fetch_deduplicated_bytes_total counter",
+        f"douyin_fetch_deduplicated_bytes_total {summary['bytes_deduplicated']}",
+        "# TYPE douyin_fetch_reused_bytes_total counter",
+        f"douyin_fetch_reused_bytes_total {summary['bytes_reused']}",
+        "# TYPE douyin_fetch_peak_rss_megabytes gauge",
+        f'douyin_fetch_peak_rss_megabytes{{process="fetcher"}} {summary["peak_rss_mb"]}',
+        f'douyin_fetch_peak_rss_megabytes{{process="browser"}} {summary["peak_browser_rss_mb"]}',
+        "# TYPE douyin_fetch_stage_seconds summary",
+    ]
+    for stage, stats in summary["stages"].items():
+        for q in ["p50", "p95", "p99"]:
+            lines.append(f'douyin_fetch_stage_seconds{{stage="{stage}",quantile="0.{q[1:]}"}} {stats[q]}')
+        lines.append(f'douyin_fetch_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, summary, results):
+    """Dump the batch metrics as Prometheus text (*.prom) or JSON (anything else)."""
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".prom"):
+            f.write(format_prometheus(summary, results))
+        else:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def add_fetch_arguments(parser):
+    """Options shared by the batch CLI and the fetch daemon."""
+    parser.add_argument("--output-dir", default="downloads", help="Directory to save mp4 files")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, help="Parallel ranged connections per media file")
+    parser.add_argument("--no-fast-path", action="store_true", help="Always use the browser instead of trying a plain HTTP page fetch first")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory of the video_id -> play URL resolution cache")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024), help="Size bound of the resolution cache (LRU eviction)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the resolution cache")
+    parser.add_argument("--keep-media-stream", action="store_true", help="Let the page stream its <video> instead of aborting it")
+    parser.add_argument("--block-analytics", action="store_true", help="Also block known analytics/telemetry hosts")
+    parser.add_argument("--block-host", action="append", default=[], help="Extra host to block in the page (repeatable)")
+    parser.add_argument("--per-host-concurrency", type=int, default=0, help="Max concurrent page requests per host, in total across --workers (0 = no limit)")
+    parser.add_argument("--per-host-rate", type=float, default=0.0, help="Max page requests per second per host, in total across --workers (0 = no limit)")
+    parser.add_argument("--max-bitrate", type=int, default=0, help="Skip variants above this bitrate in kbit/s (0 = no limit)")
+    parser.add_argument("--prefer-codec", choices=["h264", "h265"], help="Prefer variants with this codec")
+    parser.add_argument("--target-height", type=int, default=0, help="Prefer the variant closest to this resolution (short side, e.g. 720) without exceeding it")
+    parser.add_argument("--recycle-rss-mb", type=float, default=0, help="Recycle browser contexts once Chromium's summed RSS reaches this many MB (0 = never)")
+    parser.add_argument("--low-memory", action="store_true", help="Launch Chromium with trimmed headless-server flags and a small viewport")
+    parser.add_argument("--store-dir", help="Content-addressed store for hardlink dedup (default: <output-dir>/.objects)")
+    parser.add_argument("--no-dedup", action="store_true", help="Do not hash-link downloads into the content store")
+    parser.add_argument("--overwrite", action="store_true", help="Download again even when <video_id>.mp4 already has the server's Content-Length")
+
+
+def policy_from_args(args):
+    block_hosts = (ANALYTICS_HOSTS if args.block_analytics else []) + args.block_host
+    return RequestPolicy(abort_media=not args.keep_media_stream, block_hosts=block_hosts)
+
+
+def selection_from_args(args):
+    return VariantSelection(max_bitrate=args.max_bitrate * 1000, prefer_codec=args.prefer_codec, target_height=args.target_height)
+
+
+def _cache_options(args):
+    if args.no_cache:
+        return None
+    return {"cache_dir": args.cache_dir, "max_bytes": int(args.cache_max_mb * 1024 * 1024)}
+
+
+def cache_from_args(args):
+    options = _cache_options(args)
+    return ResolveCache(**options) if options else None
+
+
+def _run_shard(items, output_dir, cache_options, batch_options):
+    """Run one batch on its own event loop, browser and cache connection."""
+    cache = ResolveCache(**cache_options) if cache_options else None
+    try:
+        return asyncio.run(run_batch(items, output_dir, cache=cache, **batch_options))
+    finally:
+        if cache is not None:
+            logger.info(f"Resolution cache: {cache.hits} hits, {cache.misses} misses")
+            cache.close()
+
+
+def _shard_options(batch_options, index, workers):
+    """
+    batch_options for shard `index` of `workers`: per_host_concurrency is split
+    so the shares add up to the requested total, per_host_rate evenly. The
+    split is static, so a shard that runs out of items leaves its share unused.
+    """
+    options = dict(batch_options)
+    concurrency = options.get("per_host_concurrency") or 0
+    if concurrency:
+        options["per_host_concurrency"] = concurrency // workers + (1 if index < concurrency % workers else 0)
+    if options.get("per_host_rate"):
+        options["per_host_rate"] = options["per_host_rate"] / workers
+    return options
+
+
+def run_sharded(items, output_dir, workers, cache_options=None, batch_options=None):
+    """
+    Split items round-robin over `workers` processes, each with its own
+    browser and event loop, and merge the results back in input order.
+    A crashed shard marks its own items as failed instead of losing the batch.
+    The per-host limits are totals for the whole run, so they are divided
+    between the shards (see _shard_options).
+    """
+    workers = max(1, min(workers, len(items)))
+    batch_options = batch_options or {}
+    if batch_options.get("per_host_concurrency"):
+        # Every shard needs at least one slot; 0 would mean "no limit".
+        workers = min(workers, batch_options["per_host_concurrency"])
+    results = [None] * len(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_run_shard, items[i::workers], output_dir, cache_options, _shard_options(batch_options, i, workers))
+            for i in range(workers)
+        ]
+        for i, future in enumerate(futures):
+            try:
+                results[i::workers] = future.result()
+            except Exception as e:
+                logger.error(f"Worker process {i} failed: {e}")
+                failed = []
+                for raw in items[i::workers]:
+                    url, vid, output_path = _prepare_job(raw, output_dir)
+                    failed.append(_result_record(raw, url, vid, output_path, False, {"error": FAIL_EXCEPTION}))
+                results[i::workers] = failed
     return results
 
 
@@ -378,8 +1320,17 @@ def main():
     parser = argparse.ArgumentParser(description="Fetch Douyin videos (URL or video_id)")
     parser.add_argument("items", nargs="*", help="Douyin URL(s) or video_id(s)")
     parser.add_argument("--file", help="Input file, one URL/video_id per line")
-    parser.add_argument("--output-dir", default="downloads", help="Directory to save mp4 files")
     parser.add_argument("--json", action="store_true", help="Print json result")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of pages processed in parallel on one shared browser")
+    parser.add_argument("--ndjson", action="store_true", help="Stream one JSON result per line as items complete (summary goes to stderr)")
+    parser.add_argument("--results-file", help="Append-only NDJSON results file; items already ok in it are skipped on restart")
+    parser.add_argument("--retries", type=int, default=2, help="Requeue retryable failures up to N times with exponential backoff")
+    parser.add_argument("--retry-base-seconds", type=float, default=5.0, help="Base delay of the retry backoff")
+    parser.add_argument("--recycle-after", type=int, default=0, help="Recycle each worker's browser context after this many items (0 = never)")
+    parser.add_argument("--metadata-only", action="store_true", help="Only return title/author/duration/bitrates/cover from aweme/detail; do not download")
+    parser.add_argument("--metrics-file", help="Write per-stage p50/p95/p99 metrics here (Prometheus text if it ends in .prom, else JSON)")
+    parser.add_argument("--workers", type=int, default=1, help="Shard the input across N processes, each with its own browser")
+    add_fetch_arguments(parser)
     args = parser.parse_args()
 
     items = read_inputs(args)
@@ -387,16 +1338,62 @@ def main():
         print("No input items")
         return
 
-    results = asyncio.run(run_batch(items, args.output_dir))
+    done = load_completed(args.results_file)
+    pending = [x for x in items if x not in done]
+    if done:
+        logger.info(f"Skipping {len(items) - len(pending)} items already ok in {args.results_file}")
+
+    batch_options = {
+        "concurrency": args.concurrency,
+        "connections": args.connections,
+        "fast_path": not args.no_fast_path,
+        "policy": policy_from_args(args),
+        "retries": args.retries,
+        "retry_base_seconds": args.retry_base_seconds,
+        "per_host_concurrency": args.per_host_concurrency,
+        "per_host_rate": args.per_host_rate,
+        "metadata_only": args.metadata_only,
+        "recycle_after": args.recycle_after,
+        "recycle_rss_mb": args.recycle_rss_mb,
+        "low_memory": args.low_memory,
+        "selection": selection_from_args(args),
+        "dedup": not args.no_dedup,
+        "store_dir": args.store_dir,
+        "reuse_existing": not args.overwrite,
+    }
+    if args.ndjson or args.results_file:
+        batch_options["sink"] = ResultSink(ndjson=args.ndjson, results_file=args.results_file)
+    started = time.monotonic()
+    fresh = []
+    if pending and args.workers > 1:
+        fresh = run_sharded(pending, args.output_dir, args.workers, _cache_options(args), batch_options)
+    elif pending:
+        fresh = _run_shard(pending, args.output_dir, _cache_options(args), batch_options)
+    by_input = dict(zip(pending, fresh))
+    results = [done.get(x) or by_input[x] for x in items]
+    rate = round(_items_per_minute(len(fresh), time.monotonic() - started), 2)
     ok = sum(1 for r in results if r["ok"])
     fail = len(results) - ok
-    if args.json:
-        print(json.dumps({"total": len(results), "ok": ok, "failed": fail, "items": results}, ensure_ascii=False, indent=2))
+    summary = stage_summary(fresh)
+    for stage, stats in summary["stages"].items():
+        logger.info(f"stage {stage}: p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s (n={stats['count']})")
+    if args.metrics_file:
+        write_metrics(args.metrics_file, summary, fresh)
+    if args.ndjson:
+        print(f"total={len(results)} ok={ok} failed={fail} items_per_minute={rate} bytes_deduplicated={summary['bytes_deduplicated']} "
+              f"bytes_reused={summary['bytes_reused']}", file=sys.stderr)
+    elif args.json:
+        print(json.dumps({"total": len(results), "ok": ok, "failed": fail, "items_per_minute": rate,
+                          "bytes_deduplicated": summary["bytes_deduplicated"], "bytes_reused": summary["bytes_reused"], "metrics": summary, "items": results},
+                         ensure_ascii=False, indent=2))
     else:
-        print(f"total={len(results)} ok={ok} failed={fail}")
+        print(f"total={len(results)} ok={ok} failed={fail} items_per_minute={rate} bytes_deduplicated={summary['bytes_deduplicated']} "
+              f"bytes_reused={summary['bytes_reused']}")
         for r in results:
             status = "OK" if r["ok"] else "FAIL"
-            print(f"[{status}] {r['input']} -> {r['output'] or r['url']}")
+            meta = r.get("metadata")
+            target = f"{meta['author']} | {meta['duration']}s | {meta['desc']}" if meta else r["output"] or r["url"]
+            print(f"[{status}] {r['input']} -> {target}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,355 @@
+"""
+Ranged, resumable media downloader used by fetch_video.py.
+
+One pooled aiohttp session is shared by every file of a batch. Files whose
+server honours byte ranges are split into fixed-size segments that
+`connections` workers fetch in offset order into a preallocated
+`<output>.part` file; progress is kept in a
+`<output>.part.json` manifest so an interrupted download resumes where it
+stopped instead of starting from zero. Disk writes run in the default
+executor so the event loop keeps serving the other connections.
+
+A SHA-256 of the content is computed while the bytes stream in (segments are
+taken in order, so the bytes in flight stay just ahead of the hash), and with a
+content store the finished file is deduplicated against earlier downloads
+(see content_store.py). With `reuse_existing` a file already on disk whose
+size matches the server's Content-Length is kept without downloading it again.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import aiohttp
+
+from content_store import ContentStore, default_store_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECTIONS = 4
+MIN_SEGMENT_BYTES = 2 * 1024 * 1024
+SEGMENT_BYTES = 4 * 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+SEGMENT_RETRIES = 3
+MANIFEST_FLUSH_SECONDS = 1.0
+READ_TIMEOUT_SECONDS = 120
+# Out-of-order segment bytes kept in memory for the streaming hash.
+HASH_BUFFER_BYTES = 32 * 1024 * 1024
+
+
+class DownloadError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_content_range_total(value):
+    # "bytes 0-0/12345" -> 12345
+    m = re.match(r"bytes\s+\d+-\d+/(\d+)", value or "")
+    return int(m.group(1)) if m else None
+
+
+def _plan_segments(size, connections):
+    # Small files get one segment per connection (at least MIN_SEGMENT_BYTES
+    # each); large ones are cut into SEGMENT_BYTES pieces taken in order.
+    step = max(MIN_SEGMENT_BYTES, min(SEGMENT_BYTES, -(-size // connections)))
+    segments = []
+    for start in range(0, size, step):
+        end = min(start + step, size) - 1
+        segments.append({"start": start, "end": end, "next": start})
+    return segments
+
+
+def _write_at(f, offset, data):
+    f.seek(offset)
+    f.write(data)
+
+
+def _preallocate(path, size):
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+class _StreamHasher:
+    """
+    SHA-256 over a file whose segments arrive out of order. Bytes at the
+    cursor are hashed as they arrive; later ones wait in memory (up to
+    HASH_BUFFER_BYTES) until the cursor reaches them. Only what did not fit,
+    or was resumed from an earlier run, is read back from disk by finish().
+    """
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self.cursor = 0
+        self._pending = {}
+        self._pending_bytes = 0
+
+    def feed(self, offset, data):
+        if offset == self.cursor:
+            self._sha.update(data)
+            self.cursor += len(data)
+            while self.cursor in self._pending:
+                chunk = self._pending.pop(self.cursor)
+                self._pending_bytes -= len(chunk)
+                self._sha.update(chunk)
+                self.cursor += len(chunk)
+        elif offset > self.cursor and self._pending_bytes + len(data) <= HASH_BUFFER_BYTES:
+            self._pending[offset] = data
+            self._pending_bytes += len(data)
+
+    def finish(self, path):
+        self._pending.clear()
+        with open(path, "rb") as f:
+            f.seek(self.cursor)
+            while True:
+                chunk = f.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                self._sha.update(chunk)
+        return self._sha.hexdigest()
+
+
+class MediaDownloader:
+    """
+    Pooled downloader; use as `async with MediaDownloader() as dl:` and call
+    `await dl.download(url, path, headers)` for every file of the batch.
+    """
+
+    def __init__(self, connections=DEFAULT_CONNECTIONS, pool_limit=64, dedup=False, store_dir=None, reuse_existing=False):
+        self.connections = max(1, connections)
+        self.pool_limit = pool_limit
+        self.dedup = dedup
+        self.store_dir = store_dir
+        self.reuse_existing = reuse_existing
+        self._session = None
+        # output path -> [lock, users]; the .part/.part.json files are per path
+        self._path_locks = {}
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_limit),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=READ_TIMEOUT_SECONDS),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def session(self):
+        """The pooled session, also used for plain page fetches."""
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def probe(self, url, headers):
+        """
+        Returns (size, accepts_ranges, validator). A one-byte ranged GET is used
+        instead of HEAD because signed CDN URLs often reject other methods.
+        """
+        try:
+            async with self._session.get(url, headers=dict(headers, Range="bytes=0-0")) as resp:
+                validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+                if resp.status == 206:
+                    total = _parse_content_range_total(resp.headers.get("Content-Range"))
+                    return total, total is not None, validator
+                if resp.status == 200:
+                    return resp.content_length, False, validator
+                raise DownloadError(f"Probe failed: Status {resp.status}", status=resp.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DownloadError(f"Probe failed: {e}")
+
+    async def download(self, url, output_path, headers=None):
+        """
+        Download `url` to `output_path` and return throughput stats.
+        Raises DownloadError when the file could not be completed.
+        Downloads to the same path (the same video_id requested twice) run
+        one after the other, as they share the .part file and its manifest.
+        """
+        key = os.path.abspath(output_path)
+        entry = self._path_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._download(url, output_path, headers)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._path_locks[key]
+
+    async def _download(self, url, output_path, headers):
+        headers = dict(headers or {})
+        started = time.monotonic()
+        part_path = output_path + ".part"
+        manifest_path = part_path + ".json"
+
+        size, ranged, validator = await self.probe(url, headers)
+        if self.reuse_existing and size and os.path.exists(output_path) and os.path.getsize(output_path) == size:
+            logger.info(f"{output_path} already has the expected {size} bytes, not downloading again")
+            return {
+                "bytes": size,
+                "fetched_bytes": 0,
+                "resumed_bytes": 0,
+                "seconds": round(time.monotonic() - started, 3),
+                "mb_per_s": 0.0,
+                "connections": 0,
+                "sha256": "",
+                "deduplicated_bytes": 0,
+                "reused_bytes": size,
+            }
+
+        loop = asyncio.get_running_loop()
+        hasher = _StreamHasher()
+        if ranged and size:
+            segments = _load_manifest(manifest_path, part_path, size, validator)
+            if segments is None:
+                segments = _plan_segments(size, self.connections)
+                await loop.run_in_executor(None, _preallocate, part_path, size)
+            resumed = sum(seg["next"] - seg["start"] for seg in segments)
+            if resumed:
+                logger.info(f"Resuming {output_path} at {resumed}/{size} bytes")
+            connections = await self._fetch_segments(url, headers, part_path, manifest_path, size, validator, segments, hasher)
+        else:
+            resumed = 0
+            size = await self._fetch_stream(url, headers, part_path, hasher)
+            connections = 1
+
+        digest = await loop.run_in_executor(None, hasher.finish, part_path)
+        os.replace(part_path, output_path)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        deduplicated = 0
+        if self.dedup:
+            store = ContentStore(self.store_dir or default_store_dir(output_path))
+            deduplicated = store.adopt(output_path, digest)
+
+        elapsed = time.monotonic() - started
+        fetched = size - resumed
+        mb_per_s = fetched / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Downloaded {fetched} bytes in {elapsed:.2f}s ({mb_per_s:.2f} MB/s, {connections} connections) -> {output_path}")
+        return {
+            "bytes": size,
+            "fetched_bytes": fetched,
+            "resumed_bytes": resumed,
+            "seconds": round(elapsed, 3),
+            "mb_per_s": round(mb_per_s, 3),
+            "connections": connections,
+            "sha256": digest,
+            "deduplicated_bytes": deduplicated,
+            "reused_bytes": 0,
+        }
+
+    async def _fetch_segments(self, url, headers, part_path, manifest_path, size, validator, segments, hasher):
+        """
+        Up to `connections` workers take the unfinished segments in offset order,
+        so finished bytes stay close to the hash cursor and the streaming hash
+        keeps up. Returns the number of workers used.
+        """
+        flush = {"at": time.monotonic()}
+
+        def save_progress(force=False):
+            now = time.monotonic()
+            if force or now - flush["at"] >= MANIFEST_FLUSH_SECONDS:
+                flush["at"] = now
+                _save_manifest(manifest_path, size, validator, segments)
+
+        pending = iter([seg for seg in segments if seg["next"] <= seg["end"]])
+        workers = min(self.connections, sum(1 for seg in segments if seg["next"] <= seg["end"]))
+
+        async def worker():
+            for seg in pending:
+                await self._fetch_segment(url, headers, part_path, seg, save_progress, hasher)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if any(seg["next"] <= seg["end"] for seg in segments):
+                save_progress(force=True)
+        return workers
+
+    async def _fetch_segment(self, url, headers, part_path, seg, save_progress, hasher):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        with open(part_path, "r+b") as f:
+            while seg["next"] <= seg["end"]:
+                range_headers = dict(headers, Range=f"bytes={seg['next']}-{seg['end']}")
+                try:
+                    async with self._session.get(url, headers=range_headers) as resp:
+                        if resp.status != 206:
+                            raise DownloadError(f"Range request failed: Status {resp.status}", status=resp.status)
+                        buf = bytearray()
+                        async for chunk in resp.content.iter_chunked(CHUNK_BYTES):
+                            buf += chunk
+                            if len(buf) >= CHUNK_BYTES:
+                                data = bytes(buf)
+                                await loop.run_in_executor(None, _write_at, f, seg["next"], data)
+                                hasher.feed(seg["next"], data)
+                                seg["next"] += len(data)
+                                buf.clear()
+                                save_progress()
+                        if buf:
+                            data = bytes(buf)
+                            await loop.run_in_executor(None, _write_at, f, seg["next"], data)
+                            hasher.feed(seg["next"], data)
+                            seg["next"] += len(data)
+                            save_progress()
+                    if seg["next"] <= seg["end"]:
+                        raise aiohttp.ClientPayloadError("Connection closed before segment end")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    attempt += 1
+                    if attempt > SEGMENT_RETRIES:
+                        raise DownloadError(f"Segment {seg['start']}-{seg['end']} failed: {e}")
+                    logger.warning(f"Segment {seg['start']}-{seg['end']} interrupted at {seg['next']}, retrying: {e}")
+                    await asyncio.sleep(attempt)
+
+    async def _fetch_stream(self, url, headers, part_path, hasher):
+        loop = asyncio.get_running_loop()
+        written = 0
+        try:
+            async with self._session.get(url, headers=headers) as resp:
+                if resp.status not in [200, 206]:
+                    raise DownloadError(f"Failed download: Status {resp.status}", status=resp.status)
+                with open(part_path, "wb") as f:
+                    while True:
+                        chunk = await resp.content.read(CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        await loop.run_in_executor(None, f.write, chunk)
+                        hasher.feed(written, chunk)
+                        written += len(chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DownloadError(f"Stream interrupted after {written} bytes: {e}")
+        return written
+
+
+def _load_manifest(manifest_path, part_path, size, validator):
+    """Return saved segments when the manifest matches this file, else None."""
+    if not (os.path.exists(manifest_path) and os.path.exists(part_path)):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:
+        return None
+    if manifest.get("size") != size or manifest.get("validator") != validator:
+        return None
+    if os.path.getsize(part_path) != size:
+        return None
+    return manifest.get("segments") or None
+
+
+def _save_manifest(manifest_path, size, validator, segments):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"size": size, "validator": validator, "segments": segments}, f)
+    os.replace(tmp_path, manifest_path)
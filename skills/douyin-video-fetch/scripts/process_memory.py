@@ -0,0 +1,62 @@
+"""
+Resident memory of this process and the processes it spawned (the Playwright
+driver and every Chromium browser/renderer), read from /proc.
+
+Used by fetch_video.py for per-item RSS reporting and RSS-triggered browser
+context recycling. Where /proc is unavailable every figure is 0.0, which also
+disables the RSS threshold. Child RSS is summed per process, so pages shared
+between Chromium processes are counted more than once; it is a trend signal,
+not an exact footprint.
+"""
+import os
+
+_PAGE_BYTES = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_MB = 1024 * 1024
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_BYTES
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _children_by_parent():
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                stat = f.read()
+            # The command name may contain spaces or parentheses; the ppid follows the last ")".
+            ppid = int(stat.rsplit(b")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def process_rss_mb(exclude=()):
+    """
+    (own RSS, summed RSS of all descendant processes) in MB. Processes in
+    `exclude` are left out together with their own children.
+    """
+    if not os.path.isdir("/proc"):
+        return 0.0, 0.0
+    pid = os.getpid()
+    children = _children_by_parent()
+    stack = list(children.get(pid, []))
+    total = 0
+    while stack:
+        child = stack.pop()
+        if child in exclude:
+            continue
+        total += _rss_bytes(child)
+        stack.extend(children.get(child, []))
+    return round(_rss_bytes(pid) / _MB, 1), round(total / _MB, 1)
+
+
+def children_rss_mb():
+    return process_rss_mb()[1]
@@ -0,0 +1,111 @@
+"""
+On-disk video_id -> play URL cache for fetch_video.py.
+
+Entries keep the resolved `src`, the chosen bitrate and the aweme_detail
+metadata. Their lifetime follows the expiry parameter signed into the CDN
+URL, so a cached URL is only reused while the CDN would still accept it.
+The store is a single SQLite file, bounded in size by LRU eviction.
+"""
+import json
+import os
+import sqlite3
+import time
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.cache/douyin-video-fetch")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 6 * 3600
+EXPIRY_SAFETY_SECONDS = 120
+# Query parameters Douyin/ByteDance CDNs use for the signed expiry timestamp.
+EXPIRY_PARAMS = ["x-expires", "expires", "expire", "x-oss-expires", "deadline"]
+
+
+def url_expiry(src):
+    """Unix timestamp at which a signed CDN URL stops working, or None."""
+    try:
+        query = parse_qs(urlparse(src).query)
+    except Exception:
+        return None
+    for key in EXPIRY_PARAMS:
+        values = query.get(key)
+        if values and values[0].isdigit():
+            return int(values[0])
+    return None
+
+
+def expires_at_for(src, now=None):
+    now = time.time() if now is None else now
+    expiry = url_expiry(src)
+    if expiry is None:
+        return now + DEFAULT_TTL_SECONDS
+    return expiry - EXPIRY_SAFETY_SECONDS
+
+
+class ResolveCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "resolve_cache.sqlite3")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS resolutions (
+                video_id TEXT PRIMARY KEY,
+                src TEXT NOT NULL,
+                bitrate INTEGER,
+                detail TEXT,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def get(self, video_id):
+        """Fresh entry as {src, bitrate, aweme_detail}, or None."""
+        now = time.time()
+        row = self._db.execute(
+            "SELECT src, bitrate, detail, expires_at FROM resolutions WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        if row is None or row[3] <= now:
+            if row is not None:
+                self.invalidate(video_id)
+            self.misses += 1
+            return None
+        self._db.execute("UPDATE resolutions SET last_used = ? WHERE video_id = ?", (now, video_id))
+        self._db.commit()
+        self.hits += 1
+        return {"src": row[0], "bitrate": row[1], "aweme_detail": json.loads(row[2]) if row[2] else None}
+
+    def put(self, video_id, src, bitrate=None, aweme_detail=None):
+        now = time.time()
+        detail = json.dumps(aweme_detail, ensure_ascii=False) if aweme_detail is not None else None
+        size = len(src) + (len(detail) if detail else 0)
+        self._db.execute(
+            "INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (video_id, src, bitrate, detail, expires_at_for(src, now), now, size),
+        )
+        self._evict(now)
+        self._db.commit()
+
+    def invalidate(self, video_id):
+        self._db.execute("DELETE FROM resolutions WHERE video_id = ?", (video_id,))
+        self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM resolutions WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM resolutions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for video_id, size in self._db.execute("SELECT video_id, size FROM resolutions ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((video_id,))
+            total -= size
+        self._db.executemany("DELETE FROM resolutions WHERE video_id = ?", stale)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,182 @@
+"""
+Local stand-in for the parts of douyin.com that fetch_video.py talks to, so
+the fetch pipeline can be benchmarked without network access.
+
+    GET /video/<id>                       video page with SIGI_STATE and RENDER_DATA
+                                          blobs, or a WAF challenge page for a share
+                                          of the IDs until the challenge cookie is set
+    GET /aweme/v1/web/aweme/detail/?aweme_id=<id>
+                                          aweme/detail JSON (also fetched by the page)
+    GET /media/<id>.mp4                   deterministic per-ID body with Range support,
+                                          throttled to a per-response bandwidth
+
+Run standalone with `python scripts/standin_server.py --port 8790`, or let
+bench_fetch.py start it in a child process.
+"""
+import argparse
+import asyncio
+import json
+import re
+import zlib
+from urllib.parse import quote
+
+from aiohttp import web
+
+WAF_COOKIE = "__bench_waf"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+CHALLENGE_HTML = """<!DOCTYPE html><html><head><title>Please wait...</title></head>
+<body><div id="waf-jschallenge">Please wait...</div>
+<script>var _wafchallengeid = "bench";
+setTimeout(function () {{ document.cookie = "{cookie}=1; path=/"; location.reload(); }}, {delay_ms});</script>
+</body></html>"""
+
+
+class StandInConfig:
+    def __init__(self, waf_ratio=0.0, waf_delay=1.0, media_kb=1024, bandwidth_mbps=0.0, page_kb=256, latency_ms=0):
+        self.waf_ratio = waf_ratio
+        self.waf_delay = waf_delay
+        self.media_bytes = max(1, int(media_kb * 1024))
+        self.bandwidth_bytes = bandwidth_mbps * 1024 * 1024 / 8
+        self.page_bytes = int(page_kb * 1024)
+        self.latency = latency_ms / 1000
+
+
+def challenged(video_id, ratio):
+    """Deterministic share of the IDs that get a WAF challenge first."""
+    return ratio > 0 and zlib.crc32(video_id.encode()) % 1000 < ratio * 1000
+
+
+def aweme_detail(base_url, video_id, media_bytes):
+    media = f"{base_url}/media/{video_id}.mp4"
+    return {
+        "aweme_id": video_id,
+        "desc": f"stand-in video {video_id} #bench",
+        "create_time": 1700000000,
+        "author": {"nickname": "bench author", "uid": "10001"},
+        "video": {
+            "duration": 15000,
+            "cover": {"url_list": [f"{base_url}/cover/{video_id}.jpg"]},
+            "play_addr": {"url_list": [media]},
+            "bit_rate": [
+                {"bit_rate": 2400000, "gear_name": "normal_1080_0", "is_h265": 0,
+                 "play_addr": {"width": 1080, "height": 1920, "data_size": media_bytes, "url_list": [media + "?br=1080"]}},
+                {"bit_rate": 900000, "gear_name": "normal_720_0", "is_h265": 1,
+                 "play_addr": {"width": 720, "height": 1280, "data_size": media_bytes, "url_list": [media + "?br=720"]}},
+            ],
+        },
+    }
+
+
+def video_page(base_url, video_id, page_bytes, media_bytes):
+    detail = aweme_detail(base_url, video_id, media_bytes)
+    sigi = {"ItemModule": {video_id: {"id": video_id, "desc": detail["desc"],
+                                      "video": {"playAddr": {"urlList": [detail["video"]["play_addr"]["url_list"][0]]}}}}}
+    render = {"app": {"videoDetail": {"statusCode": 0, "aweme_detail": detail}}}
+    # Real pages carry hundreds of KB of unrelated script; pad so extraction cost is realistic.
+    filler = "<script>/* " + "x" * max(0, page_bytes) + " */</script>"
+    return f"""<!DOCTYPE html><html><head><title>{detail['desc']}</title>{filler}
+<script id="SIGI_STATE" type="application/json">{json.dumps(sigi)}</script>
+<script id="RENDER_DATA" type="application/json">{quote(json.dumps(render))}</script>
+</head><body>
+<video src="{detail['video']['play_addr']['url_list'][0]}" autoplay muted></video>
+<script>fetch("/aweme/v1/web/aweme/detail/?aweme_id={video_id}");</script>
+</body></html>"""
+
+
+def media_body(video_id, size):
+    seed = f"{video_id}:".encode()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def build_app(config):
+    bodies = {}
+
+    def base_url(request):
+        return f"{request.scheme}://{request.host}"
+
+    async def handle_video(request):
+        video_id = request.match_info["video_id"]
+        if config.latency:
+            await asyncio.sleep(config.latency)
+        if challenged(video_id, config.waf_ratio) and WAF_COOKIE not in request.cookies:
+            html = CHALLENGE_HTML.format(cookie=WAF_COOKIE, delay_ms=int(config.waf_delay * 1000))
+            return web.Response(text=html, content_type="text/html")
+        html = video_page(base_url(request), video_id, config.page_bytes, config.media_bytes)
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_detail(request):
+        video_id = request.query.get("aweme_id", "")
+        if not video_id.isdigit():
+            return web.json_response({"status_code": 2053, "aweme_detail": None})
+        if config.latency:
+            await asyncio.sleep(config.latency)
+        return web.json_response({"status_code": 0, "aweme_detail": aweme_detail(base_url(request), video_id, config.media_bytes)})
+
+    async def handle_media(request):
+        video_id = request.match_info["video_id"]
+        body = bodies.get(video_id)
+        if body is None:
+            body = bodies[video_id] = media_body(video_id, config.media_bytes)
+        size = len(body)
+        start, end = 0, size - 1
+        m = re.match(r"bytes=(\d+)-(\d*)", request.headers.get("Range", ""))
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            if start >= size:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        headers = {"Accept-Ranges": "bytes", "ETag": f'"{video_id}-{size}"', "Content-Type": "video/mp4"}
+        if m:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        resp = web.StreamResponse(status=206 if m else 200, headers=headers)
+        resp.content_length = end - start + 1
+        await resp.prepare(request)
+        pos = start
+        while pos <= end:
+            chunk = body[pos:min(pos + STREAM_CHUNK_BYTES, end + 1)]
+            await resp.write(chunk)
+            pos += len(chunk)
+            if config.bandwidth_bytes:
+                await asyncio.sleep(len(chunk) / config.bandwidth_bytes)
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_get(r"/video/{video_id:\d+}", handle_video)
+    app.router.add_get("/aweme/v1/web/aweme/detail/", handle_detail)
+    app.router.add_get(r"/media/{video_id:\d+}.mp4", handle_media)
+    return app
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--waf-ratio", type=float, default=0.0, help="Share of video IDs that first get a WAF challenge page (0-1)")
+    parser.add_argument("--waf-delay", type=float, default=1.0, help="Seconds before the challenge page sets its cookie and reloads")
+    parser.add_argument("--media-kb", type=int, default=1024, help="Size of each mp4 body in KB")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="Per-response media bandwidth in Mbit/s (0 = unthrottled)")
+    parser.add_argument("--page-kb", type=int, default=256, help="Filler script size of each video page in KB")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Added latency for page and aweme/detail responses")
+
+
+def config_from_args(args):
+    return StandInConfig(
+        waf_ratio=args.waf_ratio, waf_delay=args.waf_delay, media_kb=args.media_kb,
+        bandwidth_mbps=args.bandwidth_mbps, page_kb=args.page_kb, latency_ms=args.latency_ms,
+    )
+
+
+def serve(config, host, port):
+    web.run_app(build_app(config), host=host, port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local Douyin stand-in for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    serve(config_from_args(args), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()